@@ -1,14 +1,15 @@
 #pragma once
 
-// scalar can be any scalar type such as float, double
+// scalar can be any scalar type such as float, double; the type of the
+// variable in GeNN (scalar) and in Brian (brian_scalar) can differ
 #include <stdint.h>
 #include <string>
 #include <fstream>
 #include <iostream>
 #include <cmath>
 
-template<class scalar>
-void convert_dynamic_arrays_2_dense_matrix(vector<int32_t> &source, vector<int32_t> &target, vector<scalar> &gvector, scalar *g, int srcNN, int trgNN)
+template<class scalar, class brian_scalar>
+void convert_dynamic_arrays_2_dense_matrix(vector<int32_t> &source, vector<int32_t> &target, vector<brian_scalar> &gvector, scalar *g, int srcNN, int trgNN)
 {
     assert(source.size() == target.size());
     assert(source.size() == gvector.size());
@@ -29,7 +30,7 @@ void convert_dynamic_arrays_2_dense_matrix(vector<int32_t> &source, vector<int32
             std::cerr << "*****" << std::endl;
             exit(222);
         }
-        g[source[i]*trgNN+target[i]]= gvector[i];
+        g[source[i]*trgNN+target[i]]= (scalar)gvector[i];
     }
     for (int s= 0; s < srcNN; s++) {
         for (int t= 0; t < trgNN; t++) {
@@ -77,20 +78,20 @@ void initialize_sparse_synapses(const vector<int32_t> &source, const vector<int3
 }
 
 
-template<class scalar>
-void convert_dynamic_arrays_2_sparse_synapses(const vector<scalar> &gvector, const vector<size_t> &indices,
+template<class scalar, class brian_scalar>
+void convert_dynamic_arrays_2_sparse_synapses(const vector<brian_scalar> &gvector, const vector<size_t> &indices,
                                               scalar *gv, int srcNN, int trgNN)
 {
     const size_t size = indices.size();
     for (size_t i= 0; i < size; i++) {
         // Insert postsynaptic index in correct location
-        gv[indices[i]] = gvector[i];
+        gv[indices[i]] = (scalar)gvector[i];
     }
 }
 
 
-template<class scalar>
-void convert_dense_matrix_2_dynamic_arrays(scalar *g, int srcNN, int trgNN, vector<int32_t> &source, vector<int32_t> &target, vector<scalar> &gvector)
+template<class scalar, class brian_scalar>
+void convert_dense_matrix_2_dynamic_arrays(scalar *g, int srcNN, int trgNN, vector<int32_t> &source, vector<int32_t> &target, vector<brian_scalar> &gvector)
 {
     assert(source.size() == target.size());
     assert(source.size() == gvector.size());
@@ -98,13 +99,13 @@ void convert_dense_matrix_2_dynamic_arrays(scalar *g, int srcNN, int trgNN, vect
     for (int i= 0; i < size; i++) {
         assert(source[i] < srcNN);
         assert(target[i] < trgNN);
-        gvector[i]= g[source[i]*trgNN+target[i]];
+        gvector[i]= (brian_scalar)g[source[i]*trgNN+target[i]];
     }
 }
 
-template<class scalar>
+template<class scalar, class brian_scalar>
 void convert_sparse_synapses_2_dynamic_arrays(unsigned int *rowLength, unsigned int *ind, unsigned int maxRowLength,
-                                              scalar *gv, int srcNN, int trgNN, vector<int32_t> &source, vector<int32_t> &target, vector<scalar> &gvector, unsigned int mode)
+                                              scalar *gv, int srcNN, int trgNN, vector<int32_t> &source, vector<int32_t> &target, vector<brian_scalar> &gvector, unsigned int mode)
 {
 // note: this does not preserve the original order of entries in the brian arrays - is that a problem?
     if (mode == b2g::FULL_MONTY) {
@@ -115,7 +116,7 @@ void convert_sparse_synapses_2_dynamic_arrays(unsigned int *rowLength, unsigned
             for (int j= 0; j < rowLength[i]; j++) {
                 source[cnt]= i;
                 target[cnt]= ind[(i * maxRowLength) + j];
-                gvector[cnt]= gv[(i * maxRowLength) + j];
+                gvector[cnt]= (brian_scalar)gv[(i * maxRowLength) + j];
                 cnt++;
             }
         }
@@ -124,7 +125,7 @@ void convert_sparse_synapses_2_dynamic_arrays(unsigned int *rowLength, unsigned
         size_t cnt= 0;
         for (int i= 0; i < srcNN; i++) {
             for (int j= 0; j < rowLength[i]; j++) {
-                gvector[cnt++]= gv[(i * maxRowLength) + j];
+                gvector[cnt++]= (brian_scalar)gv[(i * maxRowLength) + j];
             }
         }
     }
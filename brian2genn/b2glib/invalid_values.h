@@ -0,0 +1,40 @@
+#pragma once
+
+#include <cmath>
+#include <cstdio>
+
+// Counts NaN and very large values (the criterion used by Brian's
+// Group._check_for_invalid_states)
+template <typename T>
+inline size_t count_invalid_values(const T *values, size_t n)
+{
+    size_t invalid = 0;
+    for (size_t i = 0; i < n; i++) {
+        if (!(std::fabs((double)values[i]) <= 1e50))
+            invalid++;
+    }
+    return invalid;
+}
+
+// Copies n values from source to target (converting them to the type of the
+// target) and counts NaN and very large values in the same pass
+template <typename T, typename U>
+inline size_t copy_and_count_invalid_values(const T *source, size_t n, U *target)
+{
+    size_t invalid = 0;
+    for (size_t i = 0; i < n; i++) {
+        target[i] = (U)source[i];
+        if (!(std::fabs((double)source[i]) <= 1e50))
+            invalid++;
+    }
+    return invalid;
+}
+
+// Writes one line "<owner> <variable> <number of invalid values>" of the
+// summary read by GeNNDevice.run
+inline void write_invalid_value_count(FILE *f, const char *owner,
+                                      const char *varname, size_t count)
+{
+    if (f != NULL)
+        fprintf(f, "%s %s %lu\n", owner, varname, (unsigned long)count);
+}
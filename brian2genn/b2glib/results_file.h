@@ -0,0 +1,118 @@
+#pragma once
+
+#include <cstdio>
+#include <string>
+#include <sstream>
+#include <vector>
+
+// Writes all result arrays into a single file. The file starts with a text
+// header: the first line ("BRIAN2GENN-RESULTS <version> <data start>") states
+// where the data starts, the following lines contain one entry per array
+// ("<name> <dtype> <offset> <shape>", with the offset relative to the start of
+// the data). The data of each array starts at an offset aligned to ALIGNMENT
+// bytes. All arrays have to be declared with add before the file is opened,
+// and their data has then to be written in the same order, each array starting
+// with a call to start_array.
+class ResultsFile
+{
+public:
+    static const size_t ALIGNMENT = 64;
+
+    ResultsFile() : data_size(0), current(0), position(0), file(NULL) {}
+
+    ~ResultsFile()
+    {
+        if (file != NULL)
+            fclose(file);
+    }
+
+    // Declare a one-dimensional array with n elements
+    void add(const std::string &name, const std::string &dtype, size_t itemsize, size_t n)
+    {
+        std::ostringstream shape;
+        shape << n;
+        add_entry(name, dtype, shape.str(), itemsize*n);
+    }
+
+    // Declare a two-dimensional array with n rows of m elements
+    void add(const std::string &name, const std::string &dtype, size_t itemsize, size_t n, size_t m)
+    {
+        std::ostringstream shape;
+        shape << n << " " << m;
+        add_entry(name, dtype, shape.str(), itemsize*n*m);
+    }
+
+    bool open(const std::string &filename)
+    {
+        file = fopen(filename.c_str(), "wb");
+        if (file == NULL) {
+            fprintf(stderr, "Could not open %s for writing\n", filename.c_str());
+            return false;
+        }
+        const std::string entries = index.str();
+        char first_line[64];
+        // The first line has a fixed length, so its length does not depend on
+        // the start of the data
+        const size_t first_length = snprintf(first_line, sizeof(first_line),
+                                             "BRIAN2GENN-RESULTS 1 %20lu\n", 0ul);
+        const size_t data_start = aligned(first_length + entries.size());
+        snprintf(first_line, sizeof(first_line), "BRIAN2GENN-RESULTS 1 %20lu\n",
+                 (unsigned long)data_start);
+        fwrite(first_line, 1, first_length, file);
+        fwrite(entries.c_str(), 1, entries.size(), file);
+        pad(data_start - first_length - entries.size());
+        return true;
+    }
+
+    // Start writing the data of the next array
+    void start_array()
+    {
+        pad(offsets[current] - position);
+        position = offsets[current];
+        current++;
+    }
+
+    void write(const void *data, size_t bytes)
+    {
+        if (file == NULL || bytes == 0)
+            return;
+        fwrite(data, 1, bytes, file);
+        position += bytes;
+    }
+
+private:
+    static size_t aligned(size_t offset)
+    {
+        return (offset + ALIGNMENT - 1) / ALIGNMENT * ALIGNMENT;
+    }
+
+    void add_entry(const std::string &name, const std::string &dtype,
+                   const std::string &shape, size_t bytes)
+    {
+        data_size = aligned(data_size);
+        offsets.push_back(data_size);
+        index << name << " " << dtype << " " << data_size << " " << shape << "\n";
+        data_size += bytes;
+    }
+
+    void pad(size_t bytes)
+    {
+        if (file == NULL)
+            return;
+        static const char zeros[ALIGNMENT] = {0};
+        while (bytes > 0) {
+            size_t n = bytes;
+            if (n > ALIGNMENT)
+                n = ALIGNMENT;
+            fwrite(zeros, 1, n, file);
+            bytes -= n;
+        }
+    }
+
+    std::ostringstream index;
+    std::vector<size_t> offsets;
+    size_t data_size;
+    size_t current;
+    size_t position;
+    FILE *file;
+};
@@ -0,0 +1,31 @@
+#pragma once
+
+#include <stdint.h>
+#include <vector>
+
+// Sorts the spikes of a SpikeGeneratorGroup (sorted by time bins, as provided
+// by Brian) by neuron, so that the spikes of neuron i are stored in
+// spike_bins[row_start[i]] to spike_bins[row_end[i] - 1] (still sorted by time
+// bins). spike_bins has to provide space for all spikes. next (the index of
+// the next spike of each neuron) is initialized to row_start.
+inline void initialize_spike_generator(const std::vector<int32_t> &neuron_index,
+                                       const std::vector<int32_t> &timebins,
+                                       int N, unsigned int *row_start,
+                                       unsigned int *row_end, unsigned int *next,
+                                       int32_t *spike_bins)
+{
+    for (int i = 0; i < N; i++)
+        row_end[i] = 0;
+    for (size_t k = 0; k < neuron_index.size(); k++)
+        row_end[neuron_index[k]]++;
+    unsigned int offset = 0;
+    for (int i = 0; i < N; i++) {
+        row_start[i] = offset;
+        offset += row_end[i];
+        row_end[i] = row_start[i];
+    }
+    for (size_t k = 0; k < neuron_index.size(); k++)
+        spike_bins[row_end[neuron_index[k]]++] = timebins[k];
+    for (int i = 0; i < N; i++)
+        next[i] = row_start[i];
+}
@@ -0,0 +1,40 @@
+#pragma once
+
+#include <stdint.h>
+#include <string>
+#include <vector>
+#include <cstdio>
+
+// Writes the spikes recorded by a SpikeMonitor (neuron indices and time step
+// indices) as a bit-packed raster with one bit per neuron and time step, if
+// this takes less space than storing the indices and time steps. The file
+// starts with the number of neurons and the number of time steps (both as
+// int32), followed by one row of (N+7)/8 bytes per time step. Within each byte,
+// the most significant bit corresponds to the lowest neuron index.
+// Returns whether the raster has been written.
+inline bool write_spike_raster(const std::vector<int32_t> &i, const std::vector<int32_t> &t,
+                               int N, int n_steps, const std::string &filename)
+{
+    const size_t row_bytes = (N + 7) / 8;
+    const size_t raster_bytes = row_bytes * n_steps;
+    const size_t list_bytes = i.size() * (sizeof(int32_t) + sizeof(int32_t));
+    if (raster_bytes >= list_bytes) {
+        // Remove a raster left over from a previous run
+        remove(filename.c_str());
+        return false;
+    }
+    std::vector<unsigned char> raster(raster_bytes, 0);
+    for (size_t k = 0; k < i.size(); k++) {
+        raster[t[k]*row_bytes + i[k]/8] |= (unsigned char)(0x80 >> (i[k] % 8));
+    }
+    FILE *f = fopen(filename.c_str(), "wb");
+    if (f == NULL) {
+        fprintf(stderr, "Could not open %s for writing\n", filename.c_str());
+        return false;
+    }
+    const int32_t header[2] = {N, n_steps};
+    fwrite(header, sizeof(int32_t), 2, f);
+    fwrite(&raster[0], 1, raster_bytes, f);
+    fclose(f);
+    return true;
+}
@@ -0,0 +1,153 @@
+#pragma once
+
+#include <stdint.h>
+#include <cstdio>
+#include <cstdlib>
+#include <vector>
+#ifndef _WIN32
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <fcntl.h>
+#include <unistd.h>
+#endif
+
+// Sequential read access to a file of int32 values. On POSIX systems, the file
+// is memory-mapped and pages that have been read are released again, on
+// Windows the file is read with a small buffer.
+class Int32FileReader
+{
+public:
+    Int32FileReader(const char *filename, size_t size) : size(size), pos(0)
+    {
+#ifdef _WIN32
+        file = fopen(filename, "rb");
+        if (file == NULL) {
+            fprintf(stderr, "Could not open %s\n", filename);
+            exit(1);
+        }
+        buffer.resize(BUFFER_SIZE);
+        buffer_start = 0;
+        buffer_end = 0;
+#else
+        data = NULL;
+        released = 0;
+        fd = open(filename, O_RDONLY);
+        if (fd == -1) {
+            fprintf(stderr, "Could not open %s\n", filename);
+            exit(1);
+        }
+        if (size > 0) {
+            void *mapped = mmap(NULL, size*sizeof(int32_t), PROT_READ, MAP_PRIVATE, fd, 0);
+            if (mapped == MAP_FAILED) {
+                fprintf(stderr, "Could not memory-map %s\n", filename);
+                exit(1);
+            }
+            data = (int32_t *)mapped;
+            madvise(mapped, size*sizeof(int32_t), MADV_SEQUENTIAL);
+        }
+#endif
+    }
+
+    ~Int32FileReader()
+    {
+#ifdef _WIN32
+        fclose(file);
+#else
+        if (data != NULL)
+            munmap(data, size*sizeof(int32_t));
+        close(fd);
+#endif
+    }
+
+    bool at_end() const { return pos >= size; }
+
+    int32_t peek()
+    {
+#ifdef _WIN32
+        if (pos >= buffer_end) {
+            buffer_start = pos;
+            buffer_end = pos + fread(&buffer[0], sizeof(int32_t), BUFFER_SIZE, file);
+        }
+        return buffer[pos - buffer_start];
+#else
+        return data[pos];
+#endif
+    }
+
+    void advance() { pos++; }
+
+    void rewind()
+    {
+        pos = 0;
+#ifdef _WIN32
+        fseek(file, 0, SEEK_SET);
+        buffer_start = 0;
+        buffer_end = 0;
+#else
+        released = 0;
+#endif
+    }
+
+    // Release the memory of the values that have already been read
+    void release()
+    {
+#ifndef _WIN32
+        const size_t page_size = sysconf(_SC_PAGESIZE);
+        const size_t end = (pos*sizeof(int32_t) / page_size) * page_size;
+        if (end > released) {
+            madvise((char *)data + released, end - released, MADV_DONTNEED);
+            released = end;
+        }
+#endif
+    }
+
+private:
+    size_t size;
+    size_t pos;
+#ifdef _WIN32
+    static const size_t BUFFER_SIZE = 65536;
+    FILE *file;
+    std::vector<int32_t> buffer;
+    size_t buffer_start, buffer_end;
+#else
+    int fd;
+    int32_t *data;
+    size_t released;
+#endif
+};
+
+// Streams the spike schedule of a SpikeGeneratorGroup (sorted by time bins)
+// from disk, one window of time bins at a time.
+class SpikeStream
+{
+public:
+    SpikeStream(const char *index_filename, const char *timebin_filename, size_t num_spikes)
+        : indices(index_filename, num_spikes), timebins(timebin_filename, num_spikes) {}
+
+    // Read all spikes with time bins smaller than end_bin
+    void read_window(int32_t end_bin, std::vector<int32_t> &window_indices,
+                     std::vector<int32_t> &window_timebins)
+    {
+        window_indices.clear();
+        window_timebins.clear();
+        while (!timebins.at_end() && timebins.peek() < end_bin) {
+            window_indices.push_back(indices.peek());
+            window_timebins.push_back(timebins.peek());
+            indices.advance();
+            timebins.advance();
+        }
+        indices.release();
+        timebins.release();
+    }
+
+    // Start again from the first spike (for periodic spike generators)
+    void rewind()
+    {
+        indices.rewind();
+        timebins.rewind();
+    }
+
+private:
+    Int32FileReader indices;
+    Int32FileReader timebins;
+};
@@ -2,6 +2,7 @@
 Module implementing the bulk of the brian2genn interface by defining the "genn" device.
 '''
 
+import hashlib
 import os
 import platform
 import re
@@ -19,6 +20,11 @@ import itertools
 import numpy
 import numbers
 from collections import Counter
+from functools import reduce
+try:
+    from math import gcd
+except ImportError:  # Python 2
+    from fractions import gcd
 
 from brian2.codegen.cpp_prefs import get_msvc_env
 from brian2.codegen.translation import make_statements
@@ -42,7 +48,7 @@ from brian2.monitors.ratemonitor import PopulationRateMonitor
 from brian2.monitors.statemonitor import StateMonitor
 from brian2.utils.filetools import copy_directory, ensure_directory
 from brian2.utils.stringtools import word_substitute, get_identifiers
-from brian2.groups.group import Group, CodeRunner
+from brian2.groups.group import CodeRunner
 from brian2.groups.neurongroup import (NeuronGroup, StateUpdater, Resetter,
                                        Thresholder, SubexpressionUpdater)
 from brian2.groups.subgroup import Subgroup
@@ -60,6 +66,21 @@ __all__ = ['GeNNDevice']
 
 logger = get_logger('brian2.devices.genn')
 
+#: The file (in the ``static_arrays`` directory) storing all static arrays
+STATIC_ARRAY_FILENAME = 'static_arrays.bin'
+#: The alignment (in bytes) of each array in this file
+STATIC_ARRAY_ALIGNMENT = 64
+#: The file (in the ``results`` directory) storing all arrays after the run
+RESULTS_FILENAME = 'results.bin'
+#: The header with the support code shared by all GeNN models
+SUPPORT_CODE_HEADER = 'genn_support_code.h'
+#: The header included in all host sources, precompiled if the
+#: ``devices.genn.precompiled_header`` preference is set
+PRECOMPILED_HEADER = 'brian2genn_pch.h'
+#: The file (in the profile directory) storing the hash of the generated
+#: sources that the profile for profile-guided optimisation was collected for
+PROFILE_SOURCE_HASH_FILENAME = 'source_hash.txt'
+
 
 def stringify(code):
     '''
@@ -76,11 +97,57 @@ def stringify(code):
     return code
 
 
+#: Regular expression matching identifiers (the "words" of `word_substitute`)
+_identifier_re = re.compile(r'\b[_A-Za-z][_A-Za-z0-9]*\b')
+
+
+def compose_substitutions(substitutions):
+    '''
+    Combine a sequence of word substitutions into a single dictionary, so that
+    applying it in one pass with `substitute_words` gives the same result as
+    applying the substitutions one after the other with `word_substitute`.
+
+    Parameters
+    ----------
+    substitutions : list of (str, str)
+        The words and their replacements, in the order they would be applied.
+
+    Returns
+    -------
+    combined : dict
+        The final replacement of each word.
+    '''
+    combined = {}
+    for word, replacement in substitutions:
+        # Later substitutions also apply to the result of earlier ones
+        for key, value in list(combined.items()):
+            if word in value:
+                combined[key] = word_substitute(value, {word: replacement})
+        if word not in combined:
+            combined[word] = replacement
+    return combined
+
+
+def substitute_words(code, substitutions):
+    '''
+    Replace all words (identifiers) in the code according to a dictionary, in
+    a single pass over the code.
+    '''
+    if not substitutions:
+        return code
+    return _identifier_re.sub(lambda match: substitutions.get(match.group(0),
+                                                              match.group(0)),
+                              code)
+
+
 def freeze(code, ns):
     '''
     Support function for substituting constant values.
     '''
     # this is a bit of a hack, it should be passed to the template somehow
+    substitutions = []
+    # Use a renderer to correctly transform constants such as True or inf
+    renderer = CPPNodeRenderer()
     for k, v in iteritems(ns):
 
         if (isinstance(v, Variable) and
@@ -90,17 +157,15 @@ def freeze(code, ns):
             except NotImplementedError:
                 continue
         if isinstance(v, str):
-            code = word_substitute(code, {k: v})
+            substitutions.append((k, v))
         elif isinstance(v, numbers.Number):
-            # Use a renderer to correctly transform constants such as True or inf
-            renderer = CPPNodeRenderer()
             string_value = renderer.render_expr(repr(v))
             if v < 0:
                 string_value = '(%s)' % string_value
-            code = word_substitute(code, {k: string_value})
+            substitutions.append((k, string_value))
         else:
             pass  # don't deal with this object
-    return code
+    return substitute_words(code, compose_substitutions(substitutions))
 
 
 def get_gcc_compile_args():
@@ -129,16 +194,34 @@ def decorate(code, variables, shared_variables, parameters, do_final=True):
     parameters, such as $(.).
     '''
     # this is a bit of a hack, it should be part of the language probably
-    for v in itertools.chain(variables, shared_variables, parameters):
-        code = word_substitute(code, {v: '$(' + v + ')'})
-    code = word_substitute(code, {'dt': 'DT'}).strip()
+    substitutions = [(v, '$(' + v + ')')
+                     for v in itertools.chain(variables, shared_variables,
+                                              parameters)]
+    substitutions.append(('dt', 'DT'))
+    if do_final:
+        # Neither stringify nor the addToInSyn replacement change this
+        # identifier, it can therefore be replaced in the same pass
+        substitutions.append(('_hidden_weightmatrix',
+                              '$(_hidden_weightmatrix)'))
+    code = substitute_words(code, compose_substitutions(substitutions)).strip()
     if do_final:
         code = stringify(code)
         code = re.sub(r'addtoinSyn\s*=\s*(.*);', r'$(addToInSyn,\1);', code)
-        code = word_substitute(code, {'_hidden_weightmatrix': '$(_hidden_weightmatrix)'})
     return code
 
 
+def derived_param_code(model):
+    '''
+    Support function returning the derived parameters of a neuron or synapse
+    model as (name, code) tuples, where the code refers to the parameters by
+    their index in GeNN's parameter vector ``pars``.
+    '''
+    parameter_indices = dict((p, 'pars[%d]' % idx)
+                             for idx, p in enumerate(model.parameters))
+    return [(name, substitute_words(expr, parameter_indices))
+            for name, expr in model.derived_params]
+
+
 def extract_source_variables(variables, varname, smvariables):
     '''Support function to extract the "atomic" variables used in a variable
     that is of instance `Subexpression`.
@@ -217,6 +300,14 @@ class neuronModel(object):
         self.thresh_cond_lines = []
         self.reset_code_lines = []
         self.support_code_lines = []
+        self.extra_global_params = []
+        #: Brian arrays with the spike schedule (only for SpikeGeneratorGroups
+        #: simulated on the device)
+        self.spike_schedule = None
+        #: Variables checked for NaN or very large values after the run
+        self.invalid_value_checks = []
+        #: GeNN derived parameters as (name, C++ expression) tuples
+        self.derived_params = []
 
 
 class spikegeneratorModel(object):
@@ -256,6 +347,10 @@ class synapseModel(object):
         self.connectivity = ''
         self.delay = 0
         self.summed_variables= None
+        #: Variables checked for NaN or very large values after the run
+        self.invalid_value_checks = []
+        #: GeNN derived parameters as (name, C++ expression) tuples
+        self.derived_params = []
 
 class spikeMonitorModel(object):
     '''
@@ -266,6 +361,12 @@ class spikeMonitorModel(object):
         self.codeobject_name = ''
         self.neuronGroup = ''
         self.notSpikeGeneratorGroup = True
+        self.counts_only = False
+        self.records_variables = False
+        self.count_array = ''
+        self.N_array = ''
+        self.source_start = 0
+        self.source_stop = 0
 
 
 class rateMonitorModel(object):
@@ -277,6 +378,13 @@ class rateMonitorModel(object):
         self.codeobject_name = ''
         self.neuronGroup = ''
         self.notSpikeGeneratorGroup = True
+        self.counts_on_device = False
+        self.num_records = 0
+        self.num_source_neurons = 0
+        self.clock_dt = 0.0
+        self.rate_array = ''
+        self.t_array = ''
+        self.N_array = ''
 
 
 class stateMonitorModel(object):
@@ -295,6 +403,10 @@ class stateMonitorModel(object):
         self.trgN = 0
         self.when = ''
         self.connectivity = ''
+        self.t_array = ''
+        self.recorded_arrays = []
+        self.n_indices = 0
+        self.step = 1
 
 
 # ------------------------------------------------------------------------------
@@ -336,6 +448,30 @@ class GeNNDevice(CPPStandaloneDevice):
 
         self.connectivityDict = dict()
         self.groupDict = dict()
+        #: SpikeMonitors storing time steps instead of times (and possibly a
+        #: bit-packed raster), see the ``compact_spike_storage`` preference
+        self.compact_spike_monitors = dict()
+        self._spike_rasters = dict()
+        #: Variables that are stored with a different data type in the
+        #: generated code than the one of the Brian variable (e.g. recorded
+        #: values stored in single precision)
+        self.storage_dtypes = dict()
+        #: The index of the results file (read when first accessed after a run)
+        self._results_index = None
+        #: run_regularly operations executed as part of the neuron code on
+        #: the device (indexed by the name of the NeuronGroup)
+        self.device_run_regularly = defaultdict(list)
+        #: Spike schedules of SpikeGeneratorGroups that are streamed from disk
+        #: (indexed by the name of the group)
+        self.streamed_spikes = defaultdict(dict)
+        #: Files storing the spike schedules of streamed SpikeGeneratorGroups
+        #: after they have been written (indexed by the name of the group and
+        #: of the variable)
+        self.spike_stream_files = defaultdict(dict)
+        self.spike_streams = []
+        #: Neuron populations and variables checked for NaN or very large
+        #: values during the run (see the ``health_check_variables`` preference)
+        self.health_checks = []
 
         # Overwrite the code slots defined in standard C++ standalone
         self.code_lines = {'before_start': [],
@@ -401,6 +537,40 @@ class GeNNDevice(CPPStandaloneDevice):
         Processes abstract code into code objects and stores them in different
         arrays for `GeNNCodeObjects` and `GeNNUserCodeObjects`.
         '''
+        if template_name == 'statemonitor':
+            # The number of recorded time steps is known in advance, the
+            # template uses it to allocate the storage for the full run
+            template_kwds = dict(template_kwds or {})
+            step = self.get_step_value(owner.clock.dt_, defaultclock.dt_,
+                                       'StateMonitors', 'the simulation')
+            template_kwds['_num_records'] = (self.get_num_steps() + step - 1) // step
+            if prefs.devices.genn.statemonitor_float32:
+                for var in itervalues(template_kwds['_recorded_variables']):
+                    if var.dtype == numpy.float64:
+                        self.storage_dtypes[var] = numpy.float32
+            template_kwds['_storage_types'] = dict(
+                (varname, c_data_type(self.storage_dtypes.get(var, var.dtype)))
+                for varname, var in iteritems(template_kwds['_recorded_variables']))
+
+        if template_name == 'spikemonitor':
+            template_kwds = dict(template_kwds or {})
+            template_kwds['_compact_t'] = False
+        if (template_name == 'spikemonitor' and
+                prefs.devices.genn.compact_spike_storage and
+                't' in template_kwds.get('record_variables', {})):
+            # Store the time step index instead of the time, the times are
+            # reconstructed in get_value
+            template_kwds['_compact_t'] = True
+            record_variables = template_kwds['record_variables']
+            self.storage_dtypes[record_variables['t']] = numpy.int32
+            self.compact_spike_monitors[owner.name] = {
+                'name': owner.name,
+                'i': record_variables.get('i', None),
+                't': record_variables['t'],
+                'raster': set(record_variables) == {'i', 't'},
+                'N': len(owner.source),
+                'dt': float(defaultclock.dt_)}
+
         if '_run_regularly_' in name:
             variables['N'] = owner.variables['N']
             # Add an extra code object that executes the scalar code of
@@ -519,6 +689,139 @@ class GeNNDevice(CPPStandaloneDevice):
             self.code_objects[codeobj.name] = codeobj
         return codeobj
 
+    def get_value(self, var, access_data=True):
+        '''
+        Return the values stored in the results file after the run (as a
+        memory-mapped array), reconstruct the spike indices and times of
+        SpikeMonitors using the compact spike storage from the stored time
+        steps or spike raster, and return the spike schedule of streamed
+        SpikeGeneratorGroups.
+        '''
+        owner_name = getattr(var.owner, 'name', None)
+        streamed = self.streamed_spikes.get(owner_name, {})
+        if var.name in streamed:
+            return streamed[var.name]
+        stream_files = self.spike_stream_files.get(owner_name, {})
+        if var.name in stream_files:
+            fname, dtype = stream_files[var.name]
+            return numpy.fromfile(os.path.join(self.project_dir, fname),
+                                  dtype=dtype)
+        if not self.has_been_run:
+            return super(GeNNDevice, self).get_value(var, access_data)
+        for monitor in itervalues(self.compact_spike_monitors):
+            if var is monitor['t'] or (monitor['raster'] and var is monitor['i']):
+                break
+        else:
+            return self._read_result(var, access_data)
+
+        raster = self._read_spike_raster(monitor['name'])
+        if raster is None:
+            values = self._read_result(var, access_data)
+        elif var is monitor['t']:
+            values = raster[1]
+        else:
+            values = raster[0]
+        if var is monitor['t']:
+            values = values * monitor['dt']
+        return values
+
+    def _read_results_index(self):
+        '''
+        Read the header of the results file written after the run and return a
+        dictionary mapping array names to their dtype, offset and shape.
+        '''
+        if self._results_index is None:
+            fname = os.path.join(self.project_dir, 'results', RESULTS_FILENAME)
+            index = {}
+            if os.path.exists(fname):
+                with open(fname, 'rb') as f:
+                    first_line = f.readline()
+                    data_start = int(first_line.split()[2])
+                    header = f.read(data_start - len(first_line))
+                for line in header.decode('ascii').split('\n'):
+                    entry = line.split()
+                    if not entry:
+                        continue
+                    name, dtype, offset = entry[:3]
+                    index[name] = (numpy.dtype(dtype), data_start + int(offset),
+                                   tuple(int(size) for size in entry[3:]))
+            self._results_index = index
+        return self._results_index
+
+    def _read_result(self, var, access_data=True):
+        '''
+        Return the values of a variable after the run as a (copy-on-write)
+        memory-mapped view on the results file, so that only the parts that
+        are accessed are read from disk.
+        '''
+        try:
+            name = self.get_array_name(var, access_data=False)
+        except KeyError:
+            name = None
+        index = self._read_results_index()
+        if name not in index:
+            return super(GeNNDevice, self).get_value(var, access_data)
+        dtype, offset, shape = index[name]
+        if int(numpy.prod(shape)) == 0:
+            return numpy.zeros(shape, dtype=dtype)
+        return numpy.memmap(os.path.join(self.project_dir, 'results',
+                                         RESULTS_FILENAME),
+                            dtype=dtype, mode='c', offset=offset, shape=shape)
+
+    def _read_spike_raster(self, monitor_name):
+        '''
+        Read the bit-packed spike raster written for a SpikeMonitor (if any) and
+        return the neuron indices and time steps of the spikes.
+        '''
+        if monitor_name not in self._spike_rasters:
+            fname = os.path.join(self.project_dir, 'results',
+                                 monitor_name + '_raster.bin')
+            if not os.path.exists(fname):
+                return None
+            with open(fname, 'rb') as f:
+                N, n_steps = numpy.fromfile(f, dtype=numpy.int32, count=2)
+                packed = numpy.fromfile(f, dtype=numpy.uint8)
+            packed = packed.reshape(n_steps, -1)
+            # Unpack a limited number of time steps at a time to avoid
+            # allocating one byte per neuron and time step
+            chunk = max(1, 2**20 // max(packed.shape[1], 1))
+            indices, timesteps = [], []
+            for start in range(0, n_steps, chunk):
+                bits = numpy.unpackbits(packed[start:start + chunk], axis=1)[:, :N]
+                t, i = numpy.nonzero(bits)
+                indices.append(i.astype(numpy.int32))
+                timesteps.append(t.astype(numpy.int32) + start)
+            self._spike_rasters[monitor_name] = (
+                numpy.concatenate(indices) if indices else numpy.zeros(0, dtype=numpy.int32),
+                numpy.concatenate(timesteps) if timesteps else numpy.zeros(0, dtype=numpy.int32))
+        return self._spike_rasters[monitor_name]
+
+    def get_num_steps(self):
+        '''
+        The number of time steps simulated by the run (calculated in the same
+        way as in ``engine.cpp``).
+        '''
+        return int(self.run_duration / float(defaultclock.dt) + 1e-2)
+
+    def get_step_value(self, obj_dt, base_dt, description, base_description):
+        '''
+        Return after how many time steps of ``base_dt`` an object with time
+        step ``obj_dt`` is executed. Raises a ``NotImplementedError`` if
+        ``obj_dt`` is not a multiple of ``base_dt``.
+        '''
+        if obj_dt < base_dt:
+            raise NotImplementedError(
+                'Brian2GeNN does not support %s with a dt smaller '
+                'than the dt used by %s.' % (description,
+                                            base_description))
+        dt_mismatch = abs(((obj_dt + base_dt / 2) % base_dt) - base_dt / 2)
+        if dt_mismatch > 1e-4 * base_dt:
+            raise NotImplementedError(
+                'Brian2GeNN does not support %s where the dt is not '
+                'a multiple of the dt used by %s.' % (description,
+                                                      base_description))
+        return int(obj_dt / base_dt + 0.5)
+
     # The following two methods are only overwritten to catch assignments to the
     # delay variable -- GeNN does not support heterogeneous delays
     def fill_with_array(self, var, arr):
@@ -546,8 +849,27 @@ class GeNNDevice(CPPStandaloneDevice):
                             'this warning',
                             name_suffix='lastspike_inf', once=True)
                 arr = numpy.array(-1e4)
+        elif (isinstance(var.owner, SpikeGeneratorGroup) and
+              prefs.devices.genn.spikegenerator_streaming and
+              prefs.devices.genn.device_spikegenerators and
+              var.name in ['neuron_index', 'spike_time', '_timebins',
+                           '_period_bins']):
+            # The spike schedule is streamed from disk during the run instead
+            # of being loaded into memory (see add_device_spikegenerator)
+            self.streamed_spikes[var.owner.name][var.name] = numpy.asarray(arr)
+            if var.name != '_period_bins':
+                return
         super(GeNNDevice, self).fill_with_array(var, arr)
 
+    def resize(self, var, new_size):
+        if (isinstance(var.owner, SpikeGeneratorGroup) and
+                prefs.devices.genn.spikegenerator_streaming and
+                prefs.devices.genn.device_spikegenerators and
+                var.name in ['neuron_index', 'spike_time', '_timebins']):
+            # Streamed spike schedules are never stored in Brian's arrays
+            return
+        super(GeNNDevice, self).resize(var, new_size)
+
     def variableview_set_with_index_array(self, variableview, item,
                                           value, check_units):
         var = variableview.variable
@@ -689,7 +1011,7 @@ class GeNNDevice(CPPStandaloneDevice):
                 raise TypeError("Unknown main queue function type " + func)
 
         # generate the finalisations
-        for codeobj in itervalues(self.code_objects):
+        for _, codeobj in sorted(iteritems(self.code_objects)):
             if hasattr(codeobj.code, 'main_finalise'):
                 main_lines.append(codeobj.code.main_finalise)
         return main_lines
@@ -771,11 +1093,7 @@ class GeNNDevice(CPPStandaloneDevice):
                                                 self.static_arrays)
 
         logger.debug("static arrays: " + str(sorted(self.static_arrays.keys())))
-        static_array_specs = []
-        for name, arr in sorted(self.static_arrays.items()):
-            arr.tofile(os.path.join(directory, 'static_arrays', name))
-            static_array_specs.append(
-                (name, c_data_type(arr.dtype), arr.size, name))
+        static_array_specs, blob_size = self.write_static_arrays(directory)
 
         try:
             # Brian versions > 2.2.2.1 do not save the "contained objects" in
@@ -784,6 +1102,9 @@ class GeNNDevice(CPPStandaloneDevice):
             net_objects = _get_all_objects(self.net.objects)
         except ImportError:
             net_objects = self.net.objects
+        # Process the objects in a fixed order, so that the generated code does
+        # not depend on the iteration order of sets
+        net_objects = sorted(net_objects, key=lambda obj: obj.name)
 
         main_lines = self.make_main_lines()
 
@@ -830,6 +1151,8 @@ class GeNNDevice(CPPStandaloneDevice):
         self.dtDef = 'model.setDT(' + repr(float(defaultclock.dt)) + ');'
 
         # Process groups
+        self.process_run_regularly_operations(objects, synapse_groups,
+                                              state_monitors)
         self.process_neuron_groups(neuron_groups, objects)
         self.process_poisson_groups(objects, poisson_groups)
         self.process_spikegenerators(spikegenerator_groups)
@@ -841,17 +1164,9 @@ class GeNNDevice(CPPStandaloneDevice):
 
         # Turn anonymous namespaces into named namespaces to avoid
         # issues when cpp files are included
-        for code_object in itertools.chain(self.code_objects.values(),
-                                           self.max_row_length_code_objects.values()):
-            cpp_code = getattr(code_object.code, 'cpp_file', code_object.code)
-            if 'namespace {' in cpp_code:
-                cpp_code = cpp_code.replace('namespace {', 'namespace {} {{'.format(code_object.name))
-                cpp_code = cpp_code.replace('using namespace brian;',
-                                            'using namespace brian;\nusing namespace {};'.format(code_object.name))
-                if hasattr(code_object.code, 'cpp_file'):
-                    code_object.code.cpp_file = cpp_code
-            else:
-                code_object.code = cpp_code
+        for code_object in itertools.chain(itervalues(self.code_objects),
+                                           itervalues(self.max_row_length_code_objects)):
+            self.name_anonymous_namespace(code_object)
         # Write files from templates
         # Create an empty network.h file, this allows us to use Brian2's
         # objects.cpp template unchanged
@@ -859,8 +1174,9 @@ class GeNNDevice(CPPStandaloneDevice):
         self.header_files.add('network.h')
 
         self.generate_objects_source(arange_arrays, self.net,
-                                     static_array_specs,
                                      synapse_groups, writer)
+        self.generate_static_arrays_source(static_array_specs, blob_size,
+                                           writer)
         self.copy_source_files(writer, directory)
 
         # Rename randomkit.c so that it gets compiled by an explicit rule in
@@ -873,13 +1189,13 @@ class GeNNDevice(CPPStandaloneDevice):
         self.generate_max_row_length_code_objects(writer)
         self.generate_model_source(writer, main_lines, use_GPU)
         self.generate_main_source(writer, main_lines)
-        self.generate_engine_source(writer, objects)
+        self.generate_engine_source(writer, objects, use_GPU)
         self.generate_makefile(directory, use_GPU)
 
         # Compile and run
         if compile:
             try:
-                self.compile_source(debug, directory, use_GPU)
+                self.compile_source(debug, directory, use_GPU, with_output)
             except CalledProcessError as ex:
                 raise RuntimeError(('Project compilation failed (Command {cmd} '
                                     'failed with error code {returncode}).\n'
@@ -903,37 +1219,57 @@ class GeNNDevice(CPPStandaloneDevice):
                                                            returncode=ex.returncode)
                                        )
 
+    def get_code_object_defs(self, codeobj):
+        '''
+        Return the definitions of the array pointers and sizes used by a code
+        object (replacing ``%CONSTANTS%`` in its code).
+        '''
+        lines = []
+        # Sometimes an array is referred to by to different keys in our
+        # dictionary -- make sure to never add a line twice
+        seen = set()
+        for k, v in sorted(iteritems(codeobj.variables)):
+            if not isinstance(v, ArrayVariable):
+                continue
+            try:
+                if isinstance(v, DynamicArrayVariable):
+                    if get_var_ndim(v) != 1:
+                        continue
+                    dyn_array_name = self.dynamic_arrays[v]
+                    array_name = self.arrays[v]
+                    new_lines = [
+                        '{c_type}* const {array_name} = &{dyn_array_name}[0];'.format(
+                            c_type=c_data_type(self.storage_dtypes.get(v, v.dtype)),
+                            array_name=array_name,
+                            dyn_array_name=dyn_array_name),
+                        'const int _num{k} = {dyn_array_name}.size();'.format(
+                            k=k, dyn_array_name=dyn_array_name)]
+                else:
+                    new_lines = ['const int _num%s = %s;' % (k, v.size)]
+            except TypeError:
+                continue
+            for line in new_lines:
+                if line not in seen:
+                    seen.add(line)
+                    lines.append(line)
+        return lines
+
+    def name_anonymous_namespace(self, codeobj):
+        '''
+        Turn the anonymous namespace of a code object into a named namespace to
+        avoid issues when cpp files are included.
+        '''
+        cpp_code = getattr(codeobj.code, 'cpp_file', codeobj.code)
+        if 'namespace {' in cpp_code:
+            cpp_code = cpp_code.replace('namespace {', 'namespace {} {{'.format(codeobj.name))
+            cpp_code = cpp_code.replace('using namespace brian;',
+                                        'using namespace brian;\nusing namespace {};'.format(codeobj.name))
+            if hasattr(codeobj.code, 'cpp_file'):
+                codeobj.code.cpp_file = cpp_code
+        else:
+            codeobj.code = cpp_code
+
     def generate_code_objects(self, writer):
-        # Generate data for non-constant values
-        code_object_defs = defaultdict(list)
-        for codeobj in itervalues(self.code_objects):
-            lines = []
-            for k, v in iteritems(codeobj.variables):
-                if isinstance(v, ArrayVariable):
-                    try:
-                        if isinstance(v, DynamicArrayVariable):
-                            if get_var_ndim(v) == 1:
-                                dyn_array_name = self.dynamic_arrays[v]
-                                array_name = self.arrays[v]
-                                line = '{c_type}* const {array_name} = &{dyn_array_name}[0];'
-                                line = line.format(c_type=c_data_type(v.dtype),
-                                                   array_name=array_name,
-                                                   dyn_array_name=dyn_array_name)
-                                lines.append(line)
-                                line = 'const int _num{k} = {dyn_array_name}.size();'
-                                line = line.format(k=k,
-                                                   dyn_array_name=dyn_array_name)
-                                lines.append(line)
-                        else:
-                            lines.append('const int _num%s = %s;' % (k, v.size))
-                    except TypeError:
-                        pass
-            for line in lines:
-                # Sometimes an array is referred to by to different keys in our
-                # dictionary -- make sure to never add a line twice
-                if not line in code_object_defs[codeobj.name]:
-                    code_object_defs[codeobj.name].append(line)
-        # Generate the code objects
         for codeobj in itervalues(self.code_objects):
             ns = codeobj.variables
             # TODO: fix these freeze/CONSTANTS hacks somehow - they work but not elegant.
@@ -943,7 +1279,8 @@ class GeNNDevice(CPPStandaloneDevice):
                 if isinstance(codeobj.code, MultiTemplate):
                     code = freeze(codeobj.code.cpp_file, ns)
                     code = code.replace('%CONSTANTS%', '\n'.join(
-                        code_object_defs[codeobj.name]))
+                        self.get_code_object_defs(codeobj)))
+                    code = self.apply_storage_dtypes(code)
                     code = '#include "objects.h"\n' + code
 
                     writer.write('code_objects/' + codeobj.name + '.cpp', code)
@@ -955,46 +1292,14 @@ class GeNNDevice(CPPStandaloneDevice):
                         'code_objects/' + codeobj.name + '.h')
 
     def generate_max_row_length_code_objects(self, writer):
-        # Generate data for non-constant values
-        code_object_defs = defaultdict(set)
-        for codeobj in itervalues(self.max_row_length_code_objects):
-            for k, v in iteritems(codeobj.variables):
-                if isinstance(v, ArrayVariable):
-                    try:
-                        if isinstance(v, DynamicArrayVariable):
-                            if get_var_ndim(v) == 1:
-                                dyn_array_name = self.dynamic_arrays[v]
-                                array_name = self.arrays[v]
-                                # do the const stuff
-                                line = '{c_type}* const {array_name} = &{dyn_array_name}[0];'
-                                line = line.format(c_type=c_data_type(v.dtype),
-                                                   array_name=array_name,
-                                                   dyn_array_name=dyn_array_name)
-                                code_object_defs[codeobj.name].add(line)
-                                line = 'const int _num{k} = {dyn_array_name}.size();'
-                                line = line.format(k=k,
-                                                   dyn_array_name=dyn_array_name)
-                                code_object_defs[codeobj.name].add(line)
-                        else:
-                            array_name = self.arrays[v]
-                            line = '{c_type} {array_name}[{size}];'
-                            line = line.format(c_type=c_data_type(v.dtype),
-                                               array_name=array_name,
-                                               size=v.size)
-                            code_object_defs[codeobj.name].add('const int _num%s = %s;' % (k, v.size))
-                    except TypeError:
-                        pass
-    
         for codeobj in itervalues(self.max_row_length_code_objects):
             ns = codeobj.variables
             # TODO: fix these freeze/CONSTANTS hacks somehow - they work but not elegant.
             code = freeze(codeobj.code, ns)
             code = code.replace('%CONSTANTS%', '\n'.join(
-                        code_object_defs[codeobj.name]))
+                        self.get_code_object_defs(codeobj)))
             writer.write('code_objects/' + codeobj.name + '.cpp', code)
 
-              
-            
     def run(self, directory, use_GPU, with_output):
         gpu_arg = "1" if use_GPU else "0"
         if gpu_arg == "1":
@@ -1022,36 +1327,46 @@ class GeNNDevice(CPPStandaloneDevice):
                 check_call(["./main", "test", str(self.run_duration)],
                            cwd=directory)
         self.has_been_run = True
+        self._results_index = None
         last_run_info = open(
             os.path.join(directory, 'results/last_run_info.txt'), 'r').read()
         self._last_run_time, self._last_run_completed_fraction = map(float,
                                                                      last_run_info.split())
 
-        # The following is a verbatim copy of the respective code in
-        # CPPStandaloneDevice.run. In the long run, we can hopefully implement
-        # this on the device-independent level, see #761 and discussion in
-        # #750.
-
-        # Make sure that integration did not create NaN or very large values
-        owners = [var.owner for var in self.arrays]
-        # We don't want to check the same owner twice but var.owner is a
-        # weakproxy which we can't put into a set. We therefore store the name
-        # of all objects we already checked. Furthermore, under some specific
-        # instances a variable might have been created whose owner no longer
-        # exists (e.g. a `_sub_idx` variable for a subgroup) -- we ignore the
-        # resulting reference error.
-        already_checked = set()
-        for owner in owners:
-            try:
-                if owner.name in already_checked:
-                    continue
-                if isinstance(owner, Group):
-                    owner._check_for_invalid_states()
-                    already_checked.add(owner.name)
-            except ReferenceError:
-                pass
-
-    def compile_source(self, debug, directory, use_GPU):
+        # Report a run stopped early by the health check
+        fname = os.path.join(directory, 'results', 'health_check.txt')
+        if os.path.exists(fname):
+            with open(fname, 'r') as f:
+                entry = f.read().split()
+            if entry:
+                logger.warn(("The run was stopped at t={t}s, since NaN or "
+                             "very large values were detected in the "
+                             "variables {variables} of '{name}'.").format(
+                                 t=entry[0], name=entry[1],
+                                 variables=', '.join(entry[2:])),
+                            name_suffix='health_check')
+
+        # Make sure that integration did not create NaN or very large values.
+        # Instead of loading every state variable (as
+        # Group._check_for_invalid_states does), read the number of invalid
+        # values counted by the generated code while copying the variables
+        # back from GeNN.
+        fname = os.path.join(directory, 'results', 'invalid_states.txt')
+        if os.path.exists(fname):
+            with open(fname, 'r') as f:
+                for line in f:
+                    entry = line.split()
+                    if len(entry) != 3 or int(entry[2]) == 0:
+                        continue
+                    owner_name, varname = entry[:2]
+                    logger.warn(("{name}'s variable '{k}' has NaN, very large "
+                                 "values, or encountered an error in numerical "
+                                 "integration. This is usually a sign that an "
+                                 "unstable or invalid integration method was "
+                                 "chosen.").format(name=owner_name, k=varname),
+                                name_suffix="invalid_values", once=True)
+
+    def compile_source(self, debug, directory, use_GPU, with_output=True):
         if prefs.devices.genn.path is not None:
             genn_path = prefs.devices.genn.path
             logger.debug('Using GeNN path from preference: '
@@ -1106,6 +1421,7 @@ class GeNNDevice(CPPStandaloneDevice):
                 raise RuntimeError('Set the CUDA_PATH environment variable or '
                                    'the devices.genn.cuda_path preference.')
 
+        profile_guided = False
         with std_silent(debug):
             if os.sys.platform == 'win32':
                 # Make sure that all environment variables are upper case
@@ -1167,20 +1483,186 @@ class GeNNDevice(CPPStandaloneDevice):
                 args += ['magicnetwork_model.cpp']
                 print(args)
                 check_call(args, cwd=directory, env=env)
-                call(["make", "clean"], cwd=directory, env=env)
-                check_call(["make"], cwd=directory, env=env)
+                if self.use_link_time_optimisation(use_GPU):
+                    # Compile GeNN's runner for link-time optimisation, the
+                    # Makefile links its objects into the main binary
+                    env['BRIAN2GENN_EXTRA_CXXFLAGS'] = (env.get('BRIAN2GENN_EXTRA_CXXFLAGS', '') +
+                                                        ' -flto').strip()
+                if prefs.devices.genn.profile_guided_optimisation and not use_GPU:
+                    # Compiled below, the training run is not part of the
+                    # compilation output
+                    profile_guided = True
+                else:
+                    if prefs.devices.genn.profile_guided_optimisation:
+                        logger.warn('Profile-guided optimisation is only '
+                                    'supported for the CPU backend, '
+                                    'ignoring the preference.',
+                                    name_suffix='pgo_gpu', once=True)
+                    # Rebuild GeNN's runner as well, its flags might have
+                    # changed (e.g. for link-time optimisation)
+                    call(["make", "clean"],
+                         cwd=os.path.join(directory, 'magicnetwork_model_CODE'),
+                         env=env)
+                    call(["make", "clean"], cwd=directory, env=env)
+                    check_call(["make"], cwd=directory, env=env)
+        if profile_guided:
+            self.compile_with_profile(directory, env, debug, with_output)
+
+    def use_link_time_optimisation(self, use_GPU):
+        '''
+        Whether GeNN's runner and the host sources are compiled with
+        link-time optimisation and linked into a single binary (only
+        supported for the CPU backend, and not on Windows).
+        '''
+        if not prefs.devices.genn.link_time_optimisation:
+            return False
+        if use_GPU or os.sys.platform == 'win32':
+            logger.warn('Link-time optimisation is only supported for the '
+                        'CPU backend with the Makefile build, ignoring the '
+                        'preference.', name_suffix='lto_unsupported',
+                        once=True)
+            return False
+        return True
+
+    def compile_with_profile(self, directory, env, debug=False,
+                             with_output=True):
+        '''
+        Compile the GeNN runner and the main binary with profile-guided
+        optimisation (GCC): if the profile directory does not contain a
+        profile for the generated sources yet, build instrumented versions
+        and run a short training simulation (a fraction of the run duration
+        given by the `devices.genn.profile_training_fraction` preference) to
+        collect it. Then rebuild using the profile. The profile directory
+        (preference `devices.genn.profile_directory`) is kept, so that later
+        builds of the same code (e.g. the members of a parameter sweep that
+        only differ in their initial values) can reuse the profile without
+        another training run. A profile collected for different sources is
+        discarded.
+        '''
+        profile_dir = prefs.devices.genn.profile_directory
+        if profile_dir is None:
+            profile_dir = os.path.join(directory, 'pgo_profile')
+        profile_dir = os.path.abspath(profile_dir)
+        ensure_directory(profile_dir)
+        source_hash = self.hash_generated_sources(directory)
+        hash_file = os.path.join(profile_dir, PROFILE_SOURCE_HASH_FILENAME)
+        profile_hash = None
+        if os.path.exists(hash_file):
+            with open(hash_file, 'r') as f:
+                profile_hash = f.read().strip()
+        profile_files = [os.path.join(root, fname)
+                         for root, _, files in os.walk(profile_dir)
+                         for fname in files if fname.endswith('.gcda')]
+        if profile_hash != source_hash or not profile_files:
+            if profile_files:
+                logger.debug('Discarding the profile in "{}", it was '
+                             'collected for different sources.'.format(profile_dir))
+                for fname in profile_files:
+                    os.remove(fname)
+            logger.debug('Building instrumented binaries for profile-guided '
+                         'optimisation.')
+            with std_silent(debug):
+                self.make_with_flags(directory, env,
+                                     '-fprofile-generate -fprofile-dir=' + profile_dir)
+            training_duration = (self.run_duration *
+                                 prefs.devices.genn.profile_training_fraction)
+            with std_silent(with_output):
+                check_call(["./main", "test", str(training_duration)],
+                           cwd=directory)
+            with open(hash_file, 'w') as f:
+                f.write(source_hash)
+        else:
+            logger.debug('Using the existing profile in "{}".'.format(profile_dir))
+        with std_silent(debug):
+            self.make_with_flags(directory, env,
+                                 '-fprofile-use -fprofile-dir=' + profile_dir +
+                                 ' -fprofile-correction')
+
+    def hash_generated_sources(self, directory):
+        '''
+        Return a hash of all C++ sources and headers in the project directory
+        (including the code generated by GeNN), used to check whether a
+        profile for profile-guided optimisation belongs to the current code.
+        '''
+        source_hash = hashlib.sha256()
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for fname in sorted(files):
+                if os.path.splitext(fname)[1] not in ['.cpp', '.cc', '.h']:
+                    continue
+                path = os.path.join(root, fname)
+                rel_path = os.path.relpath(path, directory).replace('\\', '/')
+                source_hash.update(rel_path.encode('utf-8'))
+                with open(path, 'rb') as f:
+                    source_hash.update(f.read())
+        return source_hash.hexdigest()
+
+    def make_with_flags(self, directory, env, flags):
+        '''
+        Rebuild the GeNN runner and the main binary from scratch, with
+        additional flags for compiling and linking. The flags are passed via
+        the ``BRIAN2GENN_EXTRA_CXXFLAGS`` variable, which is used in the
+        generated Makefile and in the compiler flags of GeNN's runner (see
+        ``model.cpp``).
+        '''
+        env = dict(env)
+        env['BRIAN2GENN_EXTRA_CXXFLAGS'] = (env.get('BRIAN2GENN_EXTRA_CXXFLAGS', '') +
+                                            ' ' + flags).strip()
+        env['LDFLAGS'] = (env.get('LDFLAGS', '') + ' ' + flags).strip()
+        call(["make", "clean"], cwd=os.path.join(directory,
+                                                 'magicnetwork_model_CODE'),
+             env=env)
+        pch = os.path.join(directory, PRECOMPILED_HEADER + '.gch')
+        if os.path.exists(pch):
+            os.remove(pch)
+        check_call(["make"], cwd=directory, env=env)
 
     def add_parameter(self, model, varname, variable):
         model.parameters.append(varname)
         model.pvalue.append(CPPNodeRenderer().render_expr(repr(variable.value)))
 
+    def add_derived_params(self, model, owner):
+        '''
+        Add the loop-invariant expressions that the code generator extracted
+        from the code of ``owner`` (see `GeNNCodeGenerator.extract_derived_params`)
+        as derived parameters to the model, together with the constants they
+        depend on.
+        '''
+        derived_params = getattr(owner, '_genn_derived_params', {})
+        for name, (expr, constants) in iteritems(derived_params):
+            for k, v in sorted(iteritems(constants)):
+                if k not in model.parameters:
+                    self.add_parameter(model, k, v)
+            model.derived_params.append((name, expr))
+
+    def get_genn_type(self, model, varname, variable):
+        '''
+        Return the C++ type of a variable in the GeNN model: the type of the
+        Brian variable, unless a different floating point type has been set
+        with the `devices.genn.variable_dtypes` preference.
+        '''
+        dtype = variable.dtype
+        variable_dtypes = prefs.devices.genn.variable_dtypes
+        if numpy.issubdtype(dtype, numpy.floating):
+            dtype = variable_dtypes.get(model.name + '.' + varname,
+                                        variable_dtypes.get(varname, dtype))
+            dtype = numpy.dtype(dtype)
+            if dtype not in [numpy.float32, numpy.float64]:
+                raise ValueError("Cannot use type '{}' for variable '{}' of "
+                                 "'{}', only float32 and float64 are "
+                                 "supported.".format(dtype, varname,
+                                                     model.name))
+        return c_data_type(dtype)
+
     def add_array_variable(self, model, varname, variable):
         if variable.scalar:
             model.shared_variables.append(varname)
-            model.shared_variabletypes.append(c_data_type(variable.dtype))
+            model.shared_variabletypes.append(self.get_genn_type(model, varname,
+                                                                 variable))
         else:
             model.variables.append(varname)
-            model.variabletypes.append(c_data_type(variable.dtype))
+            model.variabletypes.append(self.get_genn_type(model, varname,
+                                                          variable))
             model.variablescope[varname] = 'brian'
 
     def add_array_variables(self, model, owner):
@@ -1211,7 +1693,7 @@ class GeNNDevice(CPPStandaloneDevice):
             suffix = '_thresholder';
             lines = neuron_model.thresh_cond_lines;
             codeobj = objects[obj.name + suffix].codeobj
-            for k, v in iteritems(codeobj.variables):
+            for k, v in sorted(iteritems(codeobj.variables)):
                 if k != 'dt' and isinstance(v, Constant):
                     if k not in neuron_model.parameters:
                         self.add_parameter(neuron_model, k, v)
@@ -1228,6 +1710,67 @@ class GeNNDevice(CPPStandaloneDevice):
             self.neuron_models.append(neuron_model)
             self.groupDict[neuron_model.name] = neuron_model
 
+    def process_run_regularly_operations(self, objects, synapse_groups,
+                                         state_monitors):
+        '''
+        Determine the ``run_regularly`` operations of neuron groups that can be
+        executed as part of the neuron code on the device, instead of copying
+        the group's state to the host and back. This is the case for operations
+        that only read and write per-neuron variables of their group, where
+        these variables are not used by synapses, and where the group is not
+        recorded by a StateMonitor in the ``start`` slot (otherwise the order
+        of operations could change).
+        '''
+        if not prefs.devices.genn.device_run_regularly:
+            return
+        run_regularly_objects = [o for name, o in sorted(iteritems(objects))
+                                 if '_run_regularly' in name]
+        synaptic_variables = set()
+        for synapses in synapse_groups:
+            for obj in synapses.contained_objects:
+                codeobj = getattr(obj, 'codeobj', None)
+                if codeobj is not None:
+                    synaptic_variables.update(itervalues(codeobj.variables))
+        for run_reg in run_regularly_objects:
+            group = run_reg.group
+            if (not isinstance(group, NeuronGroup) or
+                    run_reg.when != 'start'):
+                continue
+            variables = run_reg.codeobj.variables
+            read_write = self.run_regularly_read_write[run_reg.codeobj.name]
+            used = [variables[varname]
+                    for varname in read_write['read'] | read_write['write']
+                    if varname not in ('t', 'dt')]
+            if any(getattr(var.owner, 'name', None) != group.name or
+                   not isinstance(var, ArrayVariable)
+                   for var in used):
+                continue
+            if any(variables[varname].scalar
+                   for varname in read_write['write']):
+                continue
+            if not all(self.has_genn_implementation(var)
+                       for var in itervalues(variables)
+                       if isinstance(var, Function)):
+                continue
+            if any(var in synaptic_variables for var in used):
+                continue
+            start_monitors = [mon for mon in state_monitors
+                              if mon.when == 'start' and
+                              getattr(mon.source, 'source', mon.source).name == group.name]
+            if start_monitors:
+                continue
+            self.device_run_regularly[group.name].append(run_reg)
+
+    def has_genn_implementation(self, function):
+        '''
+        Whether a function can be used in GeNN code.
+        '''
+        try:
+            function.implementations[GeNNCodeObject]
+        except KeyError:
+            return False
+        return True
+
     def process_neuron_groups(self, neuron_groups, objects):
         for obj in neuron_groups:
             # throw error if events other than spikes are used
@@ -1295,6 +1838,25 @@ class GeNNDevice(CPPStandaloneDevice):
                 combined_abstract_code['reset'] += ['lastspike = t',
                                                     'not_refractory = False']
 
+            # run_regularly operations executed on the device, they are
+            # executed at the beginning of the neuron code in the time steps
+            # where the operation is due
+            run_regularly_operations = []
+            for run_reg in self.device_run_regularly[obj.name]:
+                block = '_run_regularly_%d' % len(run_regularly_operations)
+                step = self.get_step_value(run_reg.clock.dt_, obj.dt_[:],
+                                           'run_regularly operations',
+                                           'the group')
+                combined_abstract_code[block] = [run_reg.abstract_code]
+                # Do not replace the group's own variables (e.g. t and dt
+                # with the values of the run_regularly operation's clock)
+                for varname, var in iteritems(run_reg.codeobj.variables):
+                    if varname not in combined_variables:
+                        combined_variables[varname] = var
+                        if varname in run_reg.codeobj.variable_indices:
+                            combined_variable_indices[varname] = run_reg.codeobj.variable_indices[varname]
+                run_regularly_operations.append((block, step))
+
             # Find PoissonInputs targetting this NeuronGroup
             poisson_inputs = [o for o in itervalues(objects)
                               if isinstance(o, PoissonInput) and
@@ -1320,6 +1882,7 @@ class GeNNDevice(CPPStandaloneDevice):
                                                               'neuron_code',
                                                               combined_variable_indices,
                                                               codeobj_class=GeNNCodeObject,
+                                                              template_kwds={'run_regularly_operations': run_regularly_operations},
                                                               override_conditional_write=combined_override_conditional_write,
                                                               )
 
@@ -1328,10 +1891,13 @@ class GeNNDevice(CPPStandaloneDevice):
                 # part of `generate_code_objects`.
                 del self.code_objects[codeobj.name]
 
-                for k, v in iteritems(codeobj.variables):
+                for k, v in sorted(iteritems(codeobj.variables)):
                     if k != 'dt' and isinstance(v, Constant):
                         if k not in neuron_model.parameters:
                             self.add_parameter(neuron_model, k, v)
+                self.add_derived_params(neuron_model, obj)
+                parameters = (neuron_model.parameters +
+                              [name for name, _ in neuron_model.derived_params])
 
                 update_code = codeobj.code.stateupdate_code
                 reset_code = codeobj.code.reset_code
@@ -1340,21 +1906,150 @@ class GeNNDevice(CPPStandaloneDevice):
                     code = self.fix_random_generators(neuron_model, code)
                     code = decorate(code, neuron_model.variables,
                                     neuron_model.shared_variables,
-                                    neuron_model.parameters).strip()
+                                    parameters).strip()
                     lines.append(code)
                 support_code = stringify(codeobj.code.h_file)
-                neuron_model.support_code_lines = support_code
+                neuron_model.support_code_lines = [support_code]
+            neuron_model.invalid_value_checks = self.get_invalid_value_checks(
+                neuron_model, obj)
+            self.add_health_check(neuron_model)
             self.neuron_models.append(neuron_model)
             self.groupDict[neuron_model.name] = neuron_model
 
     def process_spikegenerators(self, spikegenerator_groups):
         for obj in spikegenerator_groups:
+            if prefs.devices.genn.device_spikegenerators:
+                self.add_device_spikegenerator(obj)
+                continue
             spikegenerator_model = spikegeneratorModel()
             spikegenerator_model.name = obj.name
             spikegenerator_model.codeobject_name = obj.codeobj.name
             spikegenerator_model.N = obj.N
             self.spikegenerator_models.append(spikegenerator_model)
 
+    def add_device_spikegenerator(self, obj):
+        '''
+        Simulate a `SpikeGeneratorGroup` as a GeNN neuron population. The spike
+        schedule is uploaded to the device once, sorted by neuron: each neuron
+        stores the range of its spikes (``_row_start``/``_row_end``) in the
+        extra global parameter ``_spike_bins`` and the index of its next spike
+        (``_next``).
+        '''
+        neuron_model = neuronModel()
+        neuron_model.name = obj.name
+        neuron_model.clock = obj.clock
+        neuron_model.N = obj.N
+        for varname in ['_row_start', '_row_end', '_next']:
+            neuron_model.variables.append(varname)
+            neuron_model.variabletypes.append('unsigned int')
+            neuron_model.variablescope[varname] = 'genn'
+        neuron_model.extra_global_params.append(('_spike_bins', 'int32_t*'))
+        neuron_model.extra_global_params.append(('_period_bins', 'int32_t'))
+        timebin = ('($(_period_bins) > 0 ? ((int)(t/DT + 0.5)) % $(_period_bins) '
+                   ': (int)(t/DT + 0.5))')
+        neuron_model.code_lines.append(stringify('''
+const int _timebin = %s;
+// Start again from the first spike when the period has passed
+if ($(_period_bins) > 0 && _timebin == 0)
+    $(_next) = $(_row_start);
+''' % timebin))
+        neuron_model.thresh_cond_lines.append(
+            '$(_next) < $(_row_end) && $(_spike_bins)[$(_next)] == _timebin')
+        neuron_model.reset_code_lines.append(stringify('$(_next)++;'))
+        neuron_model.spike_schedule = {
+            'neuron_index': self.get_array_name(obj.variables['neuron_index'],
+                                                access_data=False),
+            'timebins': self.get_array_name(obj.variables['_timebins'],
+                                            access_data=False),
+            'period_bins': self.get_array_name(obj.variables['_period_bins']),
+            'stream': None}
+        if obj.name in self.streamed_spikes:
+            neuron_model.spike_schedule['stream'] = self.add_spike_stream(obj)
+        self.neuron_models.append(neuron_model)
+        self.groupDict[neuron_model.name] = neuron_model
+
+    def add_spike_stream(self, obj):
+        '''
+        Write the spike schedule of a `SpikeGeneratorGroup` to disk, so that it
+        can be streamed during the run, one window of
+        ``devices.genn.spikegenerator_window`` time steps at a time.
+        '''
+        schedule = self.streamed_spikes[obj.name]
+        window = prefs.devices.genn.spikegenerator_window
+        neuron_index = schedule.get('neuron_index',
+                                    numpy.zeros(0, dtype=numpy.int32))
+        timebins = schedule.get('_timebins', numpy.zeros(0, dtype=numpy.int32))
+        stream = {'name': obj.name,
+                  'N': obj.N,
+                  'window': window,
+                  'period': int(schedule.get('_period_bins', 0)),
+                  'num_spikes': len(timebins),
+                  'index_file': 'static_arrays/_stream_%s_neuron_index' % obj.name,
+                  'timebin_file': 'static_arrays/_stream_%s_timebins' % obj.name}
+        # The device buffer has to be large enough for the spikes of any window
+        if len(timebins):
+            stream['capacity'] = int(numpy.bincount(timebins // window).max())
+        else:
+            stream['capacity'] = 1
+        spike_time = schedule.get('spike_time',
+                                  numpy.zeros(0, dtype=numpy.float64))
+        files = [('neuron_index', stream['index_file'], neuron_index, numpy.int32),
+                 ('_timebins', stream['timebin_file'], timebins, numpy.int32),
+                 ('spike_time', 'static_arrays/_stream_%s_spike_time' % obj.name,
+                  spike_time, numpy.float64)]
+        for varname, fname, values, dtype in files:
+            numpy.asarray(values, dtype=dtype).tofile(
+                os.path.join(self.project_dir, fname))
+            # The schedule is only read back from disk if it is accessed
+            self.spike_stream_files[obj.name][varname] = (fname, dtype)
+            schedule.pop(varname, None)
+        self.spike_streams.append(stream)
+        return stream
+
+    def add_health_check(self, neuron_model):
+        '''
+        Check the variables listed in ``devices.genn.health_check_variables``
+        for NaN or very large values in the neuron code, every
+        ``devices.genn.health_check_interval`` time steps. A flag is set in a
+        device buffer if any such value is found, the host checks the flag
+        and stops the run.
+        '''
+        variables = []
+        for name in prefs.devices.genn.health_check_variables:
+            if '.' in name:
+                group_name, name = name.split('.', 1)
+                if group_name != neuron_model.name:
+                    continue
+            if name in neuron_model.variables and name not in variables:
+                variables.append(name)
+        if not variables:
+            return
+        neuron_model.extra_global_params.append(('_health', 'unsigned int*'))
+        condition = ' || '.join('!(fabs($(%s)) <= 1e50)' % name
+                                for name in variables)
+        code = '''
+// Health check: flag NaN or very large values
+if (((int)($(t)/DT + 0.5)) %% %d == 0 && (%s))
+    $(_health)[0] = 1;''' % (prefs.devices.genn.health_check_interval,
+                               condition)
+        neuron_model.code_lines.append(stringify(code))
+        self.health_checks.append((neuron_model.name, variables))
+
+    def get_invalid_value_checks(self, model, obj):
+        '''
+        Return the variables of a neuron or synapse model that are checked for
+        NaN or very large values after the run. As in
+        ``Group._check_for_invalid_states``, these are the variables updated
+        by differential equations, including shared ones.
+        '''
+        equations = getattr(obj, 'equations', None)
+        if equations is None:
+            return []
+        return [varname for varname in sorted(equations.diff_eq_names)
+                if (varname in model.variables and
+                    model.variablescope[varname] == 'brian') or
+                varname in model.shared_variables]
+
     def process_synapses(self, synapse_groups, objects):
         for obj in synapse_groups:
             synapse_model = synapseModel()
@@ -1373,6 +2068,7 @@ class GeNNDevice(CPPStandaloneDevice):
                 synapse_model.trgN = obj.target.variables['N'].get_value()
             synapse_model.connectivity = prefs.devices.genn.connectivity
             self.connectivityDict[obj.name] = synapse_model.connectivity
+            self.add_derived_params(synapse_model, obj)
 
             for pathway in obj._synaptic_updaters:
                 if pathway not in ['pre', 'post']:
@@ -1472,6 +2168,8 @@ class GeNNDevice(CPPStandaloneDevice):
                     synapse_model.support_code_lines['dynamics'] += stringify('\n'.join(kwds['support_code_lines']))
                 else:
                     synapse_model.postSyntoCurrent = '0'
+            synapse_model.invalid_value_checks = self.get_invalid_value_checks(
+                synapse_model, obj)
             self.synapse_models.append(synapse_model)
             self.groupDict[synapse_model.name] = synapse_model
 
@@ -1480,7 +2178,7 @@ class GeNNDevice(CPPStandaloneDevice):
         for code in itervalues(codeobj.code):
             identifiers |= get_identifiers(code)
         indices = codeobj.variable_indices
-        for k, v in iteritems(codeobj.variables):
+        for k, v in sorted(iteritems(codeobj.variables)):
             if k in ['_spikespace', 't', 'dt'] or k not in identifiers:
                 pass
             elif isinstance(v, Constant):
@@ -1514,9 +2212,11 @@ class GeNNDevice(CPPStandaloneDevice):
         if synapse_model.connectivity == 'DENSE':
             code = 'if (_hidden_weightmatrix != 0.0) {' + code + '}'
         code = self.fix_random_generators(synapse_model, code)
+        parameters = (synapse_model.parameters +
+                      [name for name, _ in synapse_model.derived_params])
         thecode = decorate(code, synapse_model.variables,
                            synapse_model.shared_variables,
-                           synapse_model.parameters, False).strip()
+                           parameters, False).strip()
         thecode = decorate(thecode, synapse_model.external_variables, [],
                            [], True).strip()
         synapse_model.main_code_lines[pathway] = thecode
@@ -1547,8 +2247,32 @@ class GeNNDevice(CPPStandaloneDevice):
             if isinstance(src, Subgroup):
                 src = src.source
             sm.neuronGroup = src.name
-            if isinstance(src, SpikeGeneratorGroup):
+            # Variables other than i and t are directly copied from the
+            # device by the template
+            sm.records_variables = bool(set(obj.record_variables) - {'i', 't'})
+            if (isinstance(src, SpikeGeneratorGroup) and
+                    not prefs.devices.genn.device_spikegenerators):
                 sm.notSpikeGeneratorGroup = False
+            elif not obj.record and not obj.record_variables:
+                # Only the spike counts are needed, count the spikes on the
+                # device in the reset code and only copy the counts at the
+                # end of the run
+                neuron_model = self.groupDict[src.name]
+                if '_spike_count' not in neuron_model.variables:
+                    neuron_model.variables.append('_spike_count')
+                    neuron_model.variabletypes.append('int32_t')
+                    neuron_model.variablescope['_spike_count'] = 'genn'
+                    neuron_model.reset_code_lines.append(
+                        stringify('\n$(_spike_count)++;'))
+                sm.counts_only = True
+                sm.count_array = self.get_array_name(obj.variables['count'])
+                sm.N_array = self.get_array_name(obj.variables['N'])
+                if isinstance(obj.source, Subgroup):
+                    sm.source_start = obj.source.start
+                    sm.source_stop = obj.source.stop
+                else:
+                    sm.source_start = 0
+                    sm.source_stop = src.N
             self.spike_monitor_models.append(sm)
 
             # ------------------------------------------------------------------------------
@@ -1567,10 +2291,57 @@ class GeNNDevice(CPPStandaloneDevice):
             if isinstance(src, Subgroup):
                 src = src.source
             sm.neuronGroup = src.name
-            if isinstance(src, SpikeGeneratorGroup):
+            if (isinstance(src, SpikeGeneratorGroup) and
+                    not prefs.devices.genn.device_spikegenerators):
                 sm.notSpikeGeneratorGroup = False
+            if sm.notSpikeGeneratorGroup:
+                self.add_device_rate_counter(sm, obj)
             self.rate_monitor_models.append(sm)
 
+    def add_device_rate_counter(self, rate_monitor_model, obj):
+        '''
+        Count the spikes for a `PopulationRateMonitor` in the reset code of the
+        monitored neuron population. The counts are stored in a device buffer
+        with one entry per recorded time step, the rates are calculated from
+        the buffer after the run.
+        '''
+        sm = rate_monitor_model
+        neuron_model = self.groupDict[sm.neuronGroup]
+        if isinstance(obj.source, Subgroup):
+            start, stop = obj.source.start, obj.source.stop
+        else:
+            start, stop = 0, obj.source.N
+        sm.counts_on_device = True
+        sm.num_records = self.get_num_steps()
+        sm.num_source_neurons = stop - start
+        sm.clock_dt = float(obj.clock.dt_)
+        sm.rate_array = self.get_array_name(obj.variables['rate'],
+                                            access_data=False)
+        sm.t_array = self.get_array_name(obj.variables['t'],
+                                         access_data=False)
+        sm.N_array = self.get_array_name(obj.variables['N'])
+        counter = '_ratecount_' + sm.name
+        neuron_model.extra_global_params.append((counter, 'unsigned int*'))
+        if not any('_increment_rate_count' in line
+                   for line in neuron_model.support_code_lines):
+            neuron_model.support_code_lines.append(stringify('''
+SUPPORT_CODE_FUNC void _increment_rate_count(unsigned int *count)
+{
+#ifdef __CUDA_ARCH__
+    atomicAdd(count, 1u);
+#else
+    (*count)++;
+#endif
+}
+'''))
+        code = '''
+{
+    const int _step = (int)($(t)/DT + 0.5);
+    if ($(id) >= %d && $(id) < %d)
+        _increment_rate_count(&$(%s)[_step]);
+}''' % (start, stop, counter)
+        neuron_model.reset_code_lines.append(stringify(code))
+
     def process_state_monitors(self, directory, state_monitors, writer):
         for obj in state_monitors:
             sm = stateMonitorModel()
@@ -1596,6 +2367,16 @@ class GeNNDevice(CPPStandaloneDevice):
             else:
                 sm.isSynaptic = False
                 sm.N = src.variables['N'].get_value()
+            # Names of the recording arrays, used to trim the storage that has
+            # been allocated for the full run to the recorded time steps
+            sm.t_array = self.get_array_name(obj.variables['t'],
+                                             access_data=False)
+            sm.recorded_arrays = [self.get_array_name(obj.recorded_variables[varname],
+                                                      access_data=False)
+                                  for varname in sorted(obj.record_variables)]
+            sm.n_indices = obj.variables['_indices'].size
+            sm.step = self.get_step_value(obj.clock.dt_, defaultclock.dt_,
+                                          'StateMonitors', 'the simulation')
             for varname in obj.record_variables:
                 if src.variables[varname] in itervalues(defaultclock.variables):
                     raise NotImplementedError('Recording the time t or the '
@@ -1615,7 +2396,91 @@ class GeNNDevice(CPPStandaloneDevice):
 
             self.state_monitor_models.append(sm)
 
+    def assign_model_classes(self):
+        '''
+        Determine the GeNN model classes emitted in ``model.cpp``: structurally
+        identical neuron, weight update and postsynaptic models (same code,
+        parameter names and variables) share a single class, named after the
+        first population using it. Parameter values and initial values remain
+        specific to each population.
+        '''
+        neuron_classes = {}
+        for neuron_model in self.neuron_models:
+            key = (tuple(neuron_model.code_lines),
+                   tuple(neuron_model.thresh_cond_lines),
+                   tuple(neuron_model.reset_code_lines),
+                   tuple(neuron_model.support_code_lines),
+                   tuple(neuron_model.parameters),
+                   tuple(neuron_model.variables),
+                   tuple(neuron_model.variabletypes),
+                   tuple(neuron_model.shared_variables),
+                   tuple(neuron_model.shared_variabletypes),
+                   tuple(neuron_model.extra_global_params),
+                   tuple(neuron_model.derived_params))
+            neuron_model.derived_param_code = derived_param_code(neuron_model)
+            neuron_model.defines_class = key not in neuron_classes
+            neuron_model.model_class = neuron_classes.setdefault(
+                key, neuron_model.name + 'NEURON')
+        weight_update_classes = {}
+        postsynaptic_classes = {}
+        for synapse_model in self.synapse_models:
+            key = (tuple(sorted(synapse_model.main_code_lines.items())),
+                   tuple(sorted(synapse_model.support_code_lines.items())),
+                   tuple(synapse_model.parameters),
+                   tuple(synapse_model.variables),
+                   tuple(synapse_model.variabletypes),
+                   tuple(synapse_model.shared_variables),
+                   tuple(synapse_model.shared_variabletypes),
+                   synapse_model.connectivity == 'DENSE',
+                   tuple(synapse_model.derived_params))
+            synapse_model.derived_param_code = derived_param_code(synapse_model)
+            synapse_model.defines_weight_update_class = key not in weight_update_classes
+            synapse_model.weight_update_class = weight_update_classes.setdefault(
+                key, synapse_model.name + 'WEIGHTUPDATE')
+            key = tuple(synapse_model.postSyntoCurrent)
+            synapse_model.defines_postsynaptic_class = key not in postsynaptic_classes
+            synapse_model.postsynaptic_class = postsynaptic_classes.setdefault(
+                key, synapse_model.name + 'POSTSYN')
+        num_neuron_classes = len(neuron_classes)
+        num_synapse_classes = len(weight_update_classes)
+        if (num_neuron_classes < len(self.neuron_models) or
+                num_synapse_classes < len(self.synapse_models)):
+            logger.debug('Using {} neuron model classes for {} neuron '
+                         'populations and {} weight update model classes for '
+                         '{} synapse populations.'.format(
+                             num_neuron_classes, len(self.neuron_models),
+                             num_synapse_classes, len(self.synapse_models)))
+
+    def generate_support_code_header(self, writer):
+        '''
+        Write the support code that is common to all models (the universal
+        support code of `GeNNCodeGenerator`) into a header, which is included
+        in all sources generated by GeNN instead of repeating it in the
+        support code of every neuron and synapse model. Returns the path of
+        the header relative to the directory of the code generated by GeNN
+        (``magicnetwork_model_CODE``), so that the generated code does not
+        depend on the location of the project directory.
+        '''
+        support_code = word_substitute(GeNNCodeGenerator.universal_support_code,
+                                       {'SUPPORT_CODE_FUNC':
+                                            '_BRIAN2GENN_SUPPORT_CODE_FUNC'})
+        header = '''#pragma once
+// Support code shared by all Brian2GeNN models, included in all GeNN sources
+
+#include <cmath>
+
+#ifdef __CUDACC__
+#define _BRIAN2GENN_SUPPORT_CODE_FUNC __host__ __device__ inline
+#else
+#define _BRIAN2GENN_SUPPORT_CODE_FUNC inline
+#endif
+''' + support_code
+        writer.write(SUPPORT_CODE_HEADER, header)
+        return '../' + SUPPORT_CODE_HEADER
+
     def generate_model_source(self, writer, main_lines, use_GPU):
+        self.assign_model_classes()
+        support_code_header = self.generate_support_code_header(writer)
         synapses_classes_tmp = CPPStandaloneCodeObject.templater.synapses_classes(None, None)
         writer.write('synapses_classes.*', synapses_classes_tmp)
         default_dtype = prefs.core.default_float_dtype
@@ -1631,7 +2496,7 @@ class GeNNDevice(CPPStandaloneDevice):
             if ('_synapses_create_' not in line) and ('monitor' not in line):
                 dry_main_lines.append(line)
         codeobj_inc= []
-        for codeobj in itervalues(self.code_objects):
+        for _, codeobj in sorted(iteritems(self.code_objects)):
             if ('group_variable' in codeobj.name):
                 codeobj_inc.append('#include "code_objects/'+codeobj.name+'.cpp"')
         model_tmp = GeNNCodeObject.templater.model(None, None,
@@ -1643,20 +2508,40 @@ class GeNNDevice(CPPStandaloneDevice):
                                                    main_lines=dry_main_lines,
                                                    max_row_length_include= self.max_row_length_include,
                                                    max_row_length_run_calls=self.max_row_length_run_calls,
-                                                   max_row_length_synapses=self.max_row_length_synapses,
+                                                   max_row_length_synapses=sorted(self.max_row_length_synapses),
                                                    codeobj_inc=codeobj_inc,
                                                    dtDef=self.dtDef,
                                                    prefs=prefs,
-                                                   precision=precision
+                                                   precision=precision,
+                                                   support_code_header=support_code_header
                                                    )
         writer.write('magicnetwork_model.cpp', model_tmp)
 
+    def get_compact_spike_rasters(self):
+        '''
+        Information about the SpikeMonitors that may store their spikes as a
+        bit-packed raster, for use in the ``main.cpp`` template.
+        '''
+        return [{'name': monitor['name'],
+                 'i_array': self.get_array_name(monitor['i'], access_data=False),
+                 't_array': self.get_array_name(monitor['t'], access_data=False),
+                 'N': monitor['N']}
+                for _, monitor in sorted(iteritems(self.compact_spike_monitors))
+                if monitor['raster']]
+
     def generate_main_source(self, writer, main_lines):
         header_files = sorted(self.header_files) + prefs['codegen.cpp.headers']
         runner_tmp = GeNNCodeObject.templater.main(None, None,
                                                    code_lines=self.code_lines,
                                                    neuron_models=self.neuron_models,
                                                    synapse_models=self.synapse_models,
+                                                   spike_monitor_models=self.spike_monitor_models,
+                                                   rate_monitor_models=self.rate_monitor_models,
+                                                   state_monitor_models=self.state_monitor_models,
+                                                   compact_spike_monitors=self.get_compact_spike_rasters(),
+                                                   result_arrays=self.get_result_arrays(),
+                                                   health_checks=self.health_checks,
+                                                   results_filename=RESULTS_FILENAME,
                                                    main_lines=main_lines,
                                                    header_files=header_files,
                                                    source_files=sorted(self.source_files),
@@ -1664,12 +2549,37 @@ class GeNNDevice(CPPStandaloneDevice):
                                                    )
         writer.write('main.*', runner_tmp)
 
-    def generate_engine_source(self, writer, objects):
+    def get_result_arrays(self):
+        '''
+        Return the name, kind (``'array'``, ``'dynamic'`` or ``'dynamic_2d'``)
+        and NumPy dtype of all arrays that are written to the results file
+        after the run (see `get_value`).
+        '''
+        def dtype_str(var):
+            return numpy.dtype(self.storage_dtypes.get(var, var.dtype)).str
+        result_arrays = []
+        for var, name in sorted(iteritems(self.arrays), key=lambda x: x[1]):
+            if var in self.dynamic_arrays or var in self.dynamic_arrays_2d:
+                continue
+            result_arrays.append((name, 'array', dtype_str(var)))
+        for var, name in sorted(iteritems(self.dynamic_arrays),
+                                key=lambda x: x[1]):
+            result_arrays.append((name, 'dynamic', dtype_str(var)))
+        for var, name in sorted(iteritems(self.dynamic_arrays_2d),
+                                key=lambda x: x[1]):
+            result_arrays.append((name, 'dynamic_2d', dtype_str(var)))
+        return result_arrays
+
+    def generate_engine_source(self, writer, objects, use_GPU=True):
         maximum_run_time = self._maximum_run_time
         if maximum_run_time is not None:
             maximum_run_time = float(maximum_run_time)
+        device_run_regularly = set(run_reg.name
+                                   for ops in itervalues(self.device_run_regularly)
+                                   for run_reg in ops)
         run_regularly_objects = [o for name, o in objects.items()
-                                 if '_run_regularly' in name]
+                                 if '_run_regularly' in name and
+                                 o.name not in device_run_regularly]
         run_regularly_operations = []
         for run_reg in run_regularly_objects:
             # Figure out after how many steps the operation should be executed
@@ -1678,27 +2588,17 @@ class GeNNDevice(CPPStandaloneDevice):
                     'Brian2GeNN does not support changing '
                     'the scheduling slot for "run_regularly" '
                     'operations.')
-            run_regularly_dt = run_reg.clock.dt_
-            group_dt = run_reg.group.dt_[:]
-            if run_regularly_dt < group_dt:
-                raise NotImplementedError(
-                    'Brian2GeNN does not support run_regularly '
-                    'operations with a dt smaller than the dt '
-                    'used by the group.')
-            dt_mismatch = abs(((run_regularly_dt + group_dt / 2) % group_dt) - group_dt / 2)
-            if dt_mismatch > 1e-4 * group_dt:
-                raise NotImplementedError(
-                    'Brian2GeNN does not support run_regularly '
-                    'operations where the dt is not a multiple of '
-                    'the dt used by the group.')
-            step_value = int(run_regularly_dt / group_dt + 0.5)
+            step_value = self.get_step_value(run_reg.clock.dt_,
+                                             run_reg.group.dt_[:],
+                                             'run_regularly operations',
+                                             'the group')
             codeobj_read_write = self.run_regularly_read_write[run_reg.codeobj.name]
             op = {'name': run_reg.name,
                   'order': run_reg.order,
                   'codeobj': run_reg.codeobj,
                   'owner': run_reg.group,
-                  'read': codeobj_read_write['read'],
-                  'write': codeobj_read_write['write'],
+                  'read': sorted(codeobj_read_write['read']),
+                  'write': sorted(codeobj_read_write['write']),
                   'step': step_value,
                   'isSynaptic': False}
             if isinstance(run_reg.group, Synapses):
@@ -1721,6 +2621,31 @@ class GeNNDevice(CPPStandaloneDevice):
         run_reg_state_monitor_operations = [(is_state_mon, obj)
                                             for _, _, is_state_mon, obj
                                             in sorted(run_reg_state_monitor_operations)]
+        # Variables that have to be copied from/to the device for the
+        # run_regularly operations, merged over all operations
+        run_regularly_pulls = self.merge_run_regularly_transfers(run_regularly_operations,
+                                                                 'read')
+        run_regularly_pushes = self.merge_run_regularly_transfers(run_regularly_operations,
+                                                                  'write')
+        host_work_period = self.get_host_work_period(run_regularly_operations)
+        overlap_monitors = False
+        if prefs.devices.genn.overlap_monitors:
+            # Recording the previous time step while the device simulates the
+            # next one is only possible if the host's copies of the device
+            # data are not touched in the meantime
+            if not use_GPU:
+                logger.info('Overlapping monitor recording with the '
+                            'simulation is only supported on the GPU.')
+            elif (host_work_period != 1 or run_regularly_operations or
+                  any(spkMon.records_variables
+                      for spkMon in self.spike_monitor_models)):
+                logger.info('Not overlapping monitor recording with the '
+                            'simulation, since the network uses '
+                            'run_regularly operations on the host, '
+                            'SpikeMonitors recording variables, or no '
+                            'monitors that record every time step.')
+            else:
+                overlap_monitors = True
         engine_tmp = GeNNCodeObject.templater.engine(None, None,
                                                      neuron_models=self.neuron_models,
                                                      spikegenerator_models=self.spikegenerator_models,
@@ -1729,31 +2654,177 @@ class GeNNDevice(CPPStandaloneDevice):
                                                      rate_monitor_models=self.rate_monitor_models,
                                                      state_monitor_models=self.state_monitor_models,
                                                      run_regularly_operations=run_regularly_operations,
+                                                     run_regularly_pulls=run_regularly_pulls,
+                                                     spike_streams=self.spike_streams,
+                                                     run_regularly_pushes=run_regularly_pushes,
                                                      maximum_run_time=maximum_run_time,
+                                                     host_work_period=host_work_period,
+                                                     overlap_monitors=overlap_monitors,
+                                                     time_check_interval=prefs.devices.genn.time_check_interval,
+                                                     health_checks=self.health_checks,
+                                                     health_check_interval=prefs.devices.genn.health_check_interval,
                                                      run_reg_state_monitor_operations=run_reg_state_monitor_operations
                                                      )
         writer.write('engine.*', engine_tmp)
 
+    def get_host_work_period(self, run_regularly_operations):
+        '''
+        Return the number of time steps after which host-side work (monitors,
+        spike generators, run_regularly operations, health checks) is repeated, i.e. the
+        greatest common divisor of all their step values, or ``None`` if there
+        is no host-side work at all.
+        '''
+        steps = [run_reg['step'] for run_reg in run_regularly_operations]
+        steps += [sm.step for sm in self.state_monitor_models]
+        steps += [1 for rm in self.rate_monitor_models
+                  if not rm.counts_on_device]
+        steps += [1 for spkMon in self.spike_monitor_models
+                  if not spkMon.counts_only]
+        steps += [1 for _ in self.spikegenerator_models]
+        if self.health_checks:
+            steps.append(prefs.devices.genn.health_check_interval)
+        for stream in self.spike_streams:
+            steps.append(stream['window'])
+            if stream['period'] > 0:
+                steps.append(stream['period'])
+        if not steps:
+            return None
+        return reduce(gcd, steps)
+
+    def merge_run_regularly_transfers(self, run_regularly_operations, key):
+        '''
+        Collect the variables read (``key='read'``) or written
+        (``key='write'``) by run_regularly operations. Returns a list of
+        ``(population, variable, steps)`` tuples, where ``steps`` are the
+        step values of all operations using the variable. Shared variables are
+        not included, they are stored as extra global parameters on the host.
+        '''
+        transfers = defaultdict(set)
+        for run_reg in run_regularly_operations:
+            for varname in run_reg[key]:
+                if varname in ['t', 'dt']:
+                    continue
+                var = run_reg['owner'].variables[varname]
+                if var.scalar:
+                    continue
+                transfers[(var.owner.name, var.name)].add(run_reg['step'])
+        return [(population, varname, sorted(steps))
+                for (population, varname), steps in sorted(iteritems(transfers))]
+
     def generate_makefile(self, directory, use_GPU):
         if os.sys.platform == 'win32':
             project_tmp = GeNNCodeObject.templater.project_vcxproj(None, None,
-                                                                   source_files=self.source_files)
+                                                                   source_files=sorted(self.source_files))
             open(os.path.join(directory, 'project.vcxproj'), 'w').write(
                 project_tmp)
         else:
             compile_args_gcc = get_gcc_compile_args()
             linker_flags = ' '.join(prefs.codegen.cpp.extra_link_args)
+            if prefs.devices.genn.precompiled_header:
+                self.write_precompiled_header(directory)
+                precompiled_header = PRECOMPILED_HEADER
+            else:
+                precompiled_header = None
             makefile_tmp = GeNNCodeObject.templater.Makefile(None, None,
-                                                             source_files=self.source_files,
+                                                             source_files=sorted(self.source_files),
                                                              compiler_flags=compile_args_gcc,
-                                                             linker_flags=linker_flags)
+                                                             linker_flags=linker_flags,
+                                                             precompiled_header=precompiled_header,
+                                                             link_time_optimisation=self.use_link_time_optimisation(use_GPU))
             open(os.path.join(directory, 'Makefile'), 'w').write(makefile_tmp)
 
-    def generate_objects_source(self, arange_arrays, net, static_array_specs,
-                                synapses, writer):
+    def write_precompiled_header(self, directory):
+        '''
+        Write the header with the includes shared by all host sources, which
+        the Makefile precompiles and includes in every host source. GeNN's
+        ``definitions.h`` is not part of it, since the macros it defines for
+        each population would leak into the code objects. The file is only
+        rewritten if its content changed, to not trigger a recompilation of
+        the precompiled header.
+        '''
+        includes = ['<algorithm>', '<cassert>', '<cmath>', '<cstdint>',
+                    '<cstdio>', '<cstdlib>', '<ctime>', '<fstream>',
+                    '<iostream>', '<map>', '<string>', '<vector>',
+                    '"objects.h"', '"synapses_classes.h"', '"network.h"',
+                    '"static_arrays.h"']
+        content = ('// Headers shared by all host sources (precompiled)\n' +
+                   ''.join('#include {}\n'.format(include)
+                           for include in includes))
+        fname = os.path.join(directory, PRECOMPILED_HEADER)
+        if os.path.exists(fname):
+            with open(fname, 'r') as f:
+                if f.read() == content:
+                    return
+        with open(fname, 'w') as f:
+            f.write(content)
+
+    def write_static_arrays(self, directory):
+        '''
+        Write all static arrays into a single file
+        (``static_arrays/static_arrays.bin``), each array starting at an
+        offset aligned to `STATIC_ARRAY_ALIGNMENT` bytes. The file is
+        memory-mapped by the generated code (see ``static_arrays.cpp``).
+
+        Returns
+        -------
+        static_array_specs : list of tuple
+            The name, C data type, size and offset of each static array.
+        blob_size : int
+            The total size of the file in bytes.
+        '''
+        static_array_specs = []
+        offset = 0
+        with open(os.path.join(directory, 'static_arrays',
+                               STATIC_ARRAY_FILENAME), 'wb') as f:
+            for name, arr in sorted(self.static_arrays.items()):
+                padding = -offset % STATIC_ARRAY_ALIGNMENT
+                f.write(b'\0' * padding)
+                offset += padding
+                static_array_specs.append(
+                    (name, c_data_type(arr.dtype), arr.size, offset))
+                data = numpy.ascontiguousarray(arr).tobytes()
+                f.write(data)
+                offset += len(data)
+        return static_array_specs, offset
+
+    def generate_static_arrays_source(self, static_array_specs, blob_size,
+                                      writer):
+        static_tmp = GeNNUserCodeObject.templater.static_arrays(
+            None, None,
+            static_array_specs=static_array_specs,
+            blob_size=blob_size,
+            blob_filename='static_arrays/' + STATIC_ARRAY_FILENAME)
+        writer.write('static_arrays.*', static_tmp)
+        self.header_files.add('static_arrays.h')
+        self.source_files.add('static_arrays.cpp')
+
+    def apply_storage_dtypes(self, code):
+        '''
+        Change the type of the dynamic arrays that are stored with a different
+        data type than the one of their Brian variable (see `storage_dtypes`)
+        in their declarations generated by Brian's ``objects`` template, and
+        in the pointers to their data that Brian's code generation declares
+        in code objects.
+        '''
+        for var, dtype in iteritems(self.storage_dtypes):
+            if var in self.dynamic_arrays_2d:
+                container, name = 'DynamicArray2D', self.dynamic_arrays_2d[var]
+            else:
+                container, name = 'std::vector', self.dynamic_arrays[var]
+            code = re.sub(r'\b%s<\s*%s\s*>(\s*%s\s*;)' % (re.escape(container),
+                                                           re.escape(c_data_type(var.dtype)),
+                                                           re.escape(name)),
+                          r'%s<%s>\1' % (container, c_data_type(dtype)), code)
+            if var in self.dynamic_arrays:
+                code = re.sub(r'\b%s\*([^=;*]*\b_ptr%s\s*=)' % (re.escape(c_data_type(var.dtype)),
+                                                              re.escape(self.arrays[var])),
+                              r'%s*\1' % c_data_type(dtype), code)
+        return code
+
+    def generate_objects_source(self, arange_arrays, net, synapses, writer):
         # ------------------------------------------------------------------------------
         # create the objects.cpp and objects.h code
-        the_objects = list(itervalues(self.code_objects))
+        the_objects = [codeobj for _, codeobj in sorted(iteritems(self.code_objects))]
         arr_tmp = GeNNUserCodeObject.templater.objects(
             None, None,
             array_specs=self.arrays,
@@ -1763,13 +2834,18 @@ class GeNNDevice(CPPStandaloneDevice):
             arange_arrays=arange_arrays,
             synapses=synapses,
             clocks=self.clocks,
-            static_array_specs=static_array_specs,
+            # Static arrays are declared and loaded in static_arrays.cpp
+            static_array_specs=[],
             networks=[],  # We don't want to create any networks
             get_array_filename=self.get_array_filename,
             get_array_name=self.get_array_name,
             code_objects=the_objects
         )
-        writer.write('objects.*', arr_tmp)
+        writer.write('objects.cpp',
+                     self.apply_storage_dtypes(arr_tmp.cpp_file))
+        writer.write('objects.h',
+                     self.apply_storage_dtypes(arr_tmp.h_file) +
+                     '\n#include "static_arrays.h"\n')
         self.header_files.add('objects.h')
         self.source_files.add('objects.cpp')
 
@@ -1804,7 +2880,11 @@ class GeNNDevice(CPPStandaloneDevice):
                 'Only a single run statement is supported for the genn device.')
         self.run_duration = float(duration)
         for obj in net.objects:
-            if obj.clock.name is not 'defaultclock' and not (obj.__class__ == CodeRunner):
+            # StateMonitors can record with a dt that is a multiple of the
+            # simulation dt (checked when processing the monitors)
+            if (obj.clock.name is not 'defaultclock' and
+                    not (obj.__class__ == CodeRunner) and
+                    not isinstance(obj, StateMonitor)):
                 raise NotImplementedError(
                     'Multiple clocks are not supported for the genn device')
 
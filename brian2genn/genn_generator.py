@@ -3,14 +3,17 @@ The code generator for the "genn" language. This is mostly C++ with some specifi
 decorators (mainly "__host__ __device__") to allow operation in a CUDA context.
 '''
 
+import copy
+from collections import OrderedDict
+
 from six import iteritems
 from brian2.utils.stringtools import (deindent, stripped_deindented_lines,
-                                      word_substitute)
+                                      word_substitute, get_identifiers)
 from brian2.utils.logger import get_logger
 from brian2.parsing.rendering import CPPNodeRenderer
 from brian2.core.functions import Function, DEFAULT_FUNCTIONS
 from brian2.core.preferences import prefs
-from brian2.core.variables import ArrayVariable
+from brian2.core.variables import ArrayVariable, Constant
 from brian2.codegen.generators.base import CodeGenerator
 from brian2.codegen.generators.cpp_generator import c_data_type
 from brian2genn.insyn import check_pre_code
@@ -86,6 +89,18 @@ _pow_support_code = '''
 #endif
 '''
 
+#: Functions that can be used in expressions evaluated as GeNN derived
+#: parameters (they are available in the C++ standard library under the same
+#: name)
+_derived_param_functions = {'exp', 'log', 'log10', 'sqrt', 'sin', 'cos',
+                            'tan', 'sinh', 'cosh', 'tanh', 'arcsin', 'arccos',
+                            'arctan', 'abs', 'floor', 'ceil'}
+
+#: Templates of the code objects that are part of GeNN neuron or synapse models
+#: (and can therefore use derived parameters)
+_derived_param_templates = ['neuron_code', 'synapses', 'stateupdate']
+
+
 class GeNNCodeGenerator(CodeGenerator):
     '''
     "GeNN language"
@@ -125,6 +140,128 @@ class GeNNCodeGenerator(CodeGenerator):
         else:
             return device.get_array_name(var, access_data=False)
 
+    @property
+    def use_derived_params(self):
+        return (prefs['devices.genn.derived_params'] and
+                self.template_name in _derived_param_templates)
+
+    def translate(self, code, dtype):
+        if not self.use_derived_params:
+            return super(GeNNCodeGenerator, self).translate(code, dtype)
+        # GeNNDevice.activate switches off the loop-invariant optimisations,
+        # we switch them on here to get the candidates for derived parameters
+        loop_invariant_optimisations = prefs['codegen.loop_invariant_optimisations']
+        prefs['codegen.loop_invariant_optimisations'] = True
+        try:
+            return super(GeNNCodeGenerator, self).translate(code, dtype)
+        finally:
+            prefs['codegen.loop_invariant_optimisations'] = loop_invariant_optimisations
+
+    def translate_statement_sequence(self, sc_statements, ve_statements):
+        if self.use_derived_params:
+            sc_statements, ve_statements = self.extract_derived_params(sc_statements,
+                                                                       ve_statements)
+        return super(GeNNCodeGenerator, self).translate_statement_sequence(sc_statements,
+                                                                           ve_statements)
+
+    def extract_derived_params(self, sc_statements, ve_statements):
+        '''
+        Replace loop-invariant expressions that only depend on constants and
+        ``dt`` by GeNN derived parameters, evaluated once when the model is
+        initialised. The expressions are stored in the
+        ``_genn_derived_params`` attribute of the owner (a dictionary mapping
+        the name of the derived parameter to the rendered C++ expression and
+        the `Constant` objects it refers to), the device adds them to the
+        neuron or synapse model. The remaining loop-invariant expressions are
+        moved to the vector code, since the stateupdate, reset and synapses
+        templates only use the vector code. They are renamed to be unique
+        across blocks, since the neuron code (see ``neuron_code.cpp``) emits
+        the scalar and vector code of all blocks in the same scope.
+        '''
+        derived_params = getattr(self.owner, '_genn_derived_params', None)
+        if derived_params is None:
+            derived_params = OrderedDict()
+            self.owner._genn_derived_params = derived_params
+        new_sc_statements = {}
+        new_ve_statements = {}
+        for block, statements in iteritems(sc_statements):
+            substitutions = {}
+            # Expressions for the derived parameters, used to inline them
+            # into later loop-invariant expressions
+            expressions = {}
+            remaining_sc = []
+            moved_to_vector = []
+            for statement in statements:
+                old_var = statement.var
+                if substitutions:
+                    statement = copy.copy(statement)
+                    statement.expr = word_substitute(statement.expr,
+                                                     substitutions)
+                if not (statement.var.startswith('_lio_') and statement.op == ':='):
+                    remaining_sc.append(statement)
+                    continue
+                expr = word_substitute(statement.expr,
+                                       dict((name, '(%s)' % e)
+                                            for name, e in iteritems(expressions)))
+                derived = self._derived_param(expr, statement.dtype)
+                if derived is None:
+                    # Use a name that is unique across blocks, since several
+                    # blocks end up in the same code
+                    name = '%s_%s' % (statement.var, block)
+                    statement = copy.copy(statement)
+                    statement.var = name
+                    moved_to_vector.append(statement)
+                else:
+                    rendered, constants = derived
+                    name = None
+                    for existing_name, (existing, _) in iteritems(derived_params):
+                        if existing == rendered:
+                            name = existing_name
+                            break
+                    if name is None:
+                        name = '_derived_param_%d' % len(derived_params)
+                        derived_params[name] = (rendered, constants)
+                    expressions[name] = expr
+                substitutions[old_var] = name
+            new_sc_statements[block] = remaining_sc
+            vector = []
+            for statement in ve_statements.get(block, []):
+                if substitutions:
+                    statement = copy.copy(statement)
+                    statement.expr = word_substitute(statement.expr,
+                                                     substitutions)
+                vector.append(statement)
+            new_ve_statements[block] = moved_to_vector + vector
+        for block, statements in iteritems(ve_statements):
+            if block not in new_ve_statements:
+                new_ve_statements[block] = statements
+        return new_sc_statements, new_ve_statements
+
+    def _derived_param(self, expr, dtype):
+        '''
+        Return the C++ expression for a derived parameter and the constants
+        it refers to, or ``None`` if the expression cannot be evaluated as a
+        derived parameter.
+        '''
+        if self.c_data_type(dtype) not in ['double', 'float']:
+            return None
+        constants = {}
+        for identifier in sorted(get_identifiers(expr)):
+            var = self.variables.get(identifier, None)
+            if identifier == 'dt':
+                continue
+            if isinstance(var, Constant):
+                constants[identifier] = var
+            elif not (isinstance(var, Function) and
+                      identifier in _derived_param_functions):
+                return None
+        rendered = self.translate_expression(expr)
+        # Functions defined in the support code are not available in the
+        # model definition
+        if '_brian_' in rendered:
+            return None
+        return rendered, constants
+
     def translate_expression(self, expr):
         for varname, var in iteritems(self.variables):
             if isinstance(var, Function):
@@ -275,7 +412,7 @@ class GeNNCodeGenerator(CodeGenerator):
         # Again, do the import here to avoid a circular dependency.
         from brian2.devices.device import get_device
         device = get_device()
-        for varname, var in iteritems(self.variables):
+        for varname, var in sorted(iteritems(self.variables)):
             if isinstance(var, ArrayVariable):
                 # This is the "true" array name, not the restricted pointer.
                 array_name = device.get_array_name(var)
@@ -295,7 +432,7 @@ class GeNNCodeGenerator(CodeGenerator):
         user_functions = []
         support_code = []
         hash_defines = []
-        for varname, variable in list(iteritems(self.variables)):
+        for varname, variable in sorted(iteritems(self.variables)):
             if isinstance(variable, Function):
                 hd, ps, sc, uf = self._add_user_function(varname, variable)
                 user_functions.extend(uf)
@@ -312,7 +449,9 @@ class GeNNCodeGenerator(CodeGenerator):
             if func_namespace is not None:
                 self.variables.update(func_namespace)
 
-        support_code.append(self.universal_support_code)
+        # The universal support code is not added here, it is part of the
+        # header included in all GeNN sources (see
+        # GeNNDevice.generate_support_code_header)
 
         keywords = {'pointers_lines': stripped_deindented_lines('\n'.join(pointers)),
                     'support_code_lines': stripped_deindented_lines('\n'.join(support_code)),
@@ -96,6 +96,78 @@ prefs.register_preferences(
     kernel_timing=BrianPreference(
         docs='''This preference determines whether GeNN should record kernel runtimes; note that this can affect performance.''',
         default=False,
+    ),
+    statemonitor_float32=BrianPreference(
+        docs='''This preference determines whether StateMonitors store recorded double precision values in single precision instead, which halves the memory needed for the recordings.''',
+        default=False,
+    ),
+    time_check_interval=BrianPreference(
+        docs='''The number of time steps between checks of the elapsed time (if a maximum run time has been set), while time steps without any host-side work are simulated in one go.''',
+        default=100,
+        validator=lambda value: int(value) == value and value > 0,
+    ),
+    overlap_monitors=BrianPreference(
+        docs='''This preference determines whether monitors record the data of a time step on the host while the GPU already simulates the next time step. This is only used for GPU simulations without run_regularly operations executed on the host and without SpikeMonitors that record additional variables.''',
+        default=False,
+    ),
+    health_check_variables=BrianPreference(
+        docs='''A list of variables that are checked for NaN or very large values during the run (every ``devices.genn.health_check_interval`` time steps) as part of the neuron update on the device. The run is stopped early if such a value is found. A variable name (e.g. ``'v'``) checks the variable in all NeuronGroups that have it, a name prefixed with the name of a group (e.g. ``'neurongroup.v'``) only checks the variable of this group.''',
+        default=[],
+    ),
+    health_check_interval=BrianPreference(
+        docs='''The number of time steps between checks of the variables listed in ``devices.genn.health_check_variables``.''',
+        default=100,
+        validator=lambda value: int(value) == value and value > 0,
+    ),
+    device_spikegenerators=BrianPreference(
+        docs='''This preference determines whether SpikeGeneratorGroups are simulated on the device, with their spike schedule uploaded once before the run, instead of determining their spikes on the host and copying them to the device every time step.''',
+        default=False,
+    ),
+    spikegenerator_streaming=BrianPreference(
+        docs='''This preference determines whether the spike schedules of SpikeGeneratorGroups are streamed from disk during the run (one window of time steps at a time) instead of being loaded into memory completely. Requires ``devices.genn.device_spikegenerators``.''',
+        default=False,
+    ),
+    spikegenerator_window=BrianPreference(
+        docs='''The number of time steps of the spike schedule of a SpikeGeneratorGroup that are kept in memory at a time if ``devices.genn.spikegenerator_streaming`` is used.''',
+        default=10000,
+        validator=lambda value: int(value) == value and value > 0,
+    ),
+    device_run_regularly=BrianPreference(
+        docs='''This preference determines whether run_regularly operations of neuron groups that only use the group's own variables (and no variables used by synapses) are executed as part of the neuron code on the device instead of on the host.''',
+        default=False,
+    ),
+    compact_spike_storage=BrianPreference(
+        docs='''This preference determines whether SpikeMonitors store the time step index of each spike (as a 32 bit integer) instead of its time. For monitors that only record spike indices and times, the spikes are stored as a bit-packed raster (one bit per neuron and time step) if this needs less space. Spike times and indices are reconstructed when they are accessed.''',
+        default=False,
+    ),
+    variable_dtypes=BrianPreference(
+        docs='''Floating point types for the variables of neuron and synapse models in GeNN, as a dictionary mapping variable names (applying to all groups) or names of the form 'group.variable' (applying to a single group) to 'float32' or 'float64'. The variables are converted from and to the type used by Brian when they are copied between Brian and GeNN. This allows e.g. to store synaptic weights and traces in single precision while integrating the membrane potential in double precision. Variables without an entry use the type of the Brian variable.''',
+        default={},
+        validator=lambda value: isinstance(value, dict),
+    ),
+    precompiled_header=BrianPreference(
+        docs='''This preference determines whether the generated Makefile precompiles a header with the includes shared by all host sources (objects.h, the brianlib headers and the standard library) and includes it in every host source. This reduces the compile time for models with many code objects. Only used with the Makefile (i.e. not on Windows).''',
+        default=False,
+    ),
+    profile_guided_optimisation=BrianPreference(
+        docs='''This preference determines whether the GeNN runner and the main binary are compiled with profile-guided optimisation (GCC, CPU backend only, not on Windows). Instrumented binaries are built first and used for a short training run (see devices.genn.profile_training_fraction) that collects the profile, the binaries are then rebuilt with the profile. An existing profile in devices.genn.profile_directory is reused without a new training run if it was collected for the same generated code.''',
+        default=False,
+    ),
+    profile_training_fraction=BrianPreference(
+        docs='''The fraction of the run duration simulated in the training run for profile-guided optimisation.''',
+        default=0.1,
+    ),
+    profile_directory=BrianPreference(
+        docs='''The directory storing the profile for profile-guided optimisation (if not set, the directory pgo_profile in the project directory). Setting this to a common directory allows several builds with the same generated code (e.g. the members of a parameter sweep that only differ in their initial values) to share a single training run. The profile is collected again when the generated code changes.''',
+        default=None,
+    ),
+    link_time_optimisation=BrianPreference(
+        docs='''This preference determines whether GeNN's runner and the host sources are compiled with link-time optimisation (-flto) and linked statically into a single binary instead of linking against the runner library. This allows the compiler to inline GeNN's update functions and the functions copying data to and from the device into the host code. Only supported for the CPU backend and not on Windows.''',
+        default=False,
+    ),
+    derived_params=BrianPreference(
+        docs='''This preference determines whether loop-invariant expressions in the neuron and synapse code that only depend on constants and dt (e.g. exp(-dt/tau) for exactly integrated equations) are evaluated once as GeNN derived parameters instead of in every time step. Other loop-invariant expressions are evaluated once per neuron or synapse and time step, as before.''',
+        default=False,
     )
 )
 
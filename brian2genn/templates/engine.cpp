@@ -16,6 +16,8 @@
 //--------------------------------------------------------------------------
 
 #include <ctime>
+#include <algorithm>
+#include <memory>
 #include "magicnetwork_model_CODE/definitions.h"
 #include "network.h"
 
@@ -52,6 +54,14 @@ class engine
 #include "engine.h"
 #include "network.h"
 
+{% if spike_streams %}
+// Spike schedules of SpikeGeneratorGroups streamed from disk
+{% for stream in spike_streams %}
+std::unique_ptr<SpikeStream> _spike_stream_{{stream.name}};
+{% endfor %}
+std::vector<int32_t> _stream_indices, _stream_timebins;
+{% endif %}
+
 engine::engine()
 {
   allocateMem();
@@ -81,12 +91,125 @@ void engine::run(double duration)  //!< Duration of time to run the model for
   start = std::clock();
   int riT= (int) (duration/DT+1e-2);
   double elapsed_realtime;
+  {% if host_work_period != 1 and maximum_run_time is not none %}
+  bool time_limit_reached = false;
+  {% endif %}
+
+  // Record the data of the monitors executed at the end of time step i (the
+  // data has already been copied from the device)
+  auto report_monitors = [&](int i) {
+      // report state 
+      {% for sm in state_monitor_models %}
+      {% if sm.when != 'start' %}
+      {% if sm.step > 1 %}
+      if (i % {{sm.step}} == 0)
+      {
+      {% endif %}
+      {% for var in sm.variables %}
+      {% if sm.isSynaptic %}
+      {% if sm.connectivity == 'DENSE' %}
+      convert_dense_matrix_2_dynamic_arrays({{var}}{{sm.monitored}}, {{sm.srcN}}, {{sm.trgN}},brian::_dynamic_array_{{sm.monitored}}__synaptic_pre, brian::_dynamic_array_{{sm.monitored}}__synaptic_post, brian::_dynamic_array_{{sm.monitored}}_{{var}});
+      {% else %}
+      convert_sparse_synapses_2_dynamic_arrays(rowLength{{sm.monitored}}, ind{{sm.monitored}}, maxRowLength{{sm.monitored}}, {{var}}{{sm.monitored}}, {{sm.srcN}}, {{sm.trgN}}, brian::_dynamic_array_{{sm.monitored}}__synaptic_pre, brian::_dynamic_array_{{sm.monitored}}__synaptic_post, brian::_dynamic_array_{{sm.monitored}}_{{var}}, b2g::FULL_MONTY);
+      {% endif %}
+      {% else %}
+      {% if sm.src.variables[var].scalar %}
+      *brian::_array_{{sm.monitored}}_{{var}} = {{var}}{{sm.monitored}};
+      {% else %}
+      std::copy_n({{var}}{{sm.monitored}}, {{sm.N}}, brian::_array_{{sm.monitored}}_{{var}});
+      {% endif %}
+      {% endif %}
+      {% endfor %}
+      _run_{{sm.codeobject_name}}();
+      {% if sm.step > 1 %}
+      }
+      {% endif %}
+      {% endif %}
+      {% endfor %}
+      // report spikes
+      {% for spkMon in spike_monitor_models %}
+      {% if not spkMon.counts_only %}
+      _run_{{spkMon.codeobject_name}}();
+      {% endif %}
+      {% endfor %}
+      {% for rateMon in rate_monitor_models %}
+      {% if not rateMon.counts_on_device %}
+      _run_{{rateMon.codeobject_name}}();
+      {% endif %}
+      {% endfor %}
+  };
+  {% if overlap_monitors %}
+  int last_step = -1;
+  {% endif %}
+  {% if health_checks %}
+  const char *health_check_failed = NULL;
+  {% endif %}
+  // Remove the information about a run stopped by a health check
+  remove("results/health_check.txt");
 
   for (int i= 0; i < riT; i++) {
+      {% if host_work_period != 1 %}
+      {% if host_work_period is none %}
+      // There is no host-side work, simulate all time steps in one go
+      const int batch_end = riT;
+      if (i < batch_end)
+      {% else %}
+      // Host-side work is only needed in time steps that are multiples of
+      // {{host_work_period}} and in the time steps preceding them (to copy
+      // data from the device), simulate the time steps in between in one go
+      const int batch_end = std::min(riT, (i / {{host_work_period}} + 1) * {{host_work_period}} - 1);
+      if (i % {{host_work_period}} != 0 && i < batch_end)
+      {% endif %}
+      {
+          while (i < batch_end) {
+              stepTime();
+              i++;
+              {% if maximum_run_time is not none %}
+              if (i % {{time_check_interval}} == 0) {
+                  current= std::clock();
+                  elapsed_realtime= (double) (current - start)/CLOCKS_PER_SEC;
+                  if (elapsed_realtime > {{maximum_run_time}}) {
+                      time_limit_reached = true;
+                      break;
+                  }
+              }
+              {% endif %}
+          }
+          {% if maximum_run_time is not none %}
+          if (time_limit_reached)
+              break;
+          {% endif %}
+          if (i >= riT)
+              break;
+      }
+      {% endif %}
+      {% for stream in spike_streams %}
+      {% set bin = '(i % ' ~ stream.period ~ ')' if stream.period > 0 else 'i' %}
+      if ({{bin}} % {{stream.window}} == 0)
+      {
+          // Load the spikes of the next {{stream.window}} time steps
+          {% if stream.period > 0 %}
+          if ({{bin}} == 0)
+              _spike_stream_{{stream.name}}->rewind();
+          {% endif %}
+          _spike_stream_{{stream.name}}->read_window({{bin}} + {{stream.window}}, _stream_indices, _stream_timebins);
+          initialize_spike_generator(_stream_indices, _stream_timebins, {{stream.N}},
+                                     _row_start{{stream.name}}, _row_end{{stream.name}},
+                                     _next{{stream.name}}, _spike_bins{{stream.name}});
+          push_row_start{{stream.name}}ToDevice();
+          push_row_end{{stream.name}}ToDevice();
+          push_next{{stream.name}}ToDevice();
+          push_spike_bins{{stream.name}}ToDevice({{stream.capacity}});
+      }
+      {% endfor %}
       // The StateMonitor and run_regularly operations are ordered by their "order" value
       {% for is_state_monitor, obj in run_reg_state_monitor_operations %}
       {% if is_state_monitor %}
       {% if obj.when == 'start' %}
+      {% if obj.step > 1 %}
+      if (i % {{obj.step}} == 0)
+      {
+      {% endif %}
       {% for var in obj.variables %}
       {% if obj.isSynaptic %}
       {% if obj.connectivity == 'DENSE' %}
@@ -115,11 +238,15 @@ void engine::run(double duration)  //!< Duration of time to run the model for
       {% endif %}
       {% endfor %}
       _run_{{obj.codeobject_name}}();
+      {% if obj.step > 1 %}
+      }
+      {% endif %}
       {% endif %}
       {% else %}
       if (i % {{obj['step']}} == 0)
       {
           // Execute run_regularly operation: {{obj['name']}}
+          {% set sparse_converted = [] %}
           {% for var in obj['read'] %}
         {% if var == 't' %}
         std::copy_n(&t, 1, brian::_array_{{obj['owner'].clock.name}}_t);
@@ -141,7 +268,9 @@ void engine::run(double duration)  //!< Duration of time to run the model for
                                                    {{obj['srcN']}}, {{obj['trgN']}},
                                                    brian::_dynamic_array_{{obj['owner'].name}}__synaptic_pre,
                                                    brian::_dynamic_array_{{obj['owner'].name}}__synaptic_post,
-                                                   brian::_dynamic_array_{{obj['owner'].name}}_{{var}}, b2g::FULL_MONTY);
+                                                   brian::_dynamic_array_{{obj['owner'].name}}_{{var}},
+                                                   {% if sparse_converted %}b2g::COPY_ONLY{% else %}b2g::FULL_MONTY{% endif %});
+          {% if sparse_converted.append(var) %}{% endif %}
           {% endif %}
           {% else %}
 	  {% if obj['owner'].variables[var].scalar %}
@@ -181,29 +310,32 @@ void engine::run(double duration)  //!< Duration of time to run the model for
       }
       {% endif %}
       {% endfor %}
-      {% set states_pushed = [] %}
-      {% for run_reg in run_regularly_operations %}
-      if (i % {{run_reg['step']}} == 0)  // only push state if we executed the operation
-      {
-          {% for var in run_reg['write'] %}
-              {% if not run_reg['owner'].variables[var].owner.name in states_pushed %}
-              push{{run_reg['owner'].variables[var].owner.name}}StateToDevice();
-              {% if states_pushed.append(run_reg['owner'].variables[var].owner.name) %}{% endif %}
-              {% endif %}
-          {% endfor %}
-      }
+      {% for population, var, steps in run_regularly_pushes %}
+      if ({% for step in steps %}i % {{step}} == 0{% if not loop.last %} || {% endif %}{% endfor %})  // only push variable if an operation wrote to it
+          push{{var}}{{population}}ToDevice();
       {% endfor %}
       stepTime();
       // The stepTimeGPU function already updated everything for the next time step
       iT--;
       t = iT*DT;
+      {% if overlap_monitors %}
+      // The device simulates the current time step asynchronously, record
+      // the data of the previous time step in the meantime
+      if (i > 0) {
+          iT--;
+          t = iT*DT;
+          report_monitors(i - 1);
+          iT++;
+          t = iT*DT;
+      }
+      {% endif %}
       {% for spkGen in spikegenerator_models %}
       _run_{{spkGen.codeobject_name}}();
       push{{spkGen.name}}SpikesToDevice();
       {% endfor %}
       {% set spikes_pulled = [] %}
       {% for spkMon in spike_monitor_models %}
-      {% if (spkMon.notSpikeGeneratorGroup) %}
+      {% if (spkMon.notSpikeGeneratorGroup) and not spkMon.counts_only %}
       {% if not spkMon.neuronGroup in spikes_pulled %}
       pull{{spkMon.neuronGroup}}CurrentSpikesFromDevice();
       {% if spikes_pulled.append(spkMon.neuronGroup) %}{% endif %}
@@ -211,7 +343,7 @@ void engine::run(double duration)  //!< Duration of time to run the model for
       {% endif %}
       {% endfor %}
       {% for rateMon in rate_monitor_models %}
-      {% if (rateMon.notSpikeGeneratorGroup) %}
+      {% if (rateMon.notSpikeGeneratorGroup) and not rateMon.counts_on_device %}
       {% if not rateMon.neuronGroup in spikes_pulled %}
       pull{{rateMon.neuronGroup}}CurrentSpikesFromDevice();
       {% if spikes_pulled.append(rateMon.neuronGroup) %}{% endif %}
@@ -220,55 +352,36 @@ void engine::run(double duration)  //!< Duration of time to run the model for
       {% endfor %}
       {% set states_pulled = [] %}
       {% for sm in state_monitor_models %}
-      {% if not sm.monitored in states_pulled %}
+      {% if sm.step == 1 and not sm.monitored in states_pulled %}
       pull{{sm.monitored}}StateFromDevice();
       {% if states_pulled.append(sm.monitored) %}{% endif %}
       {% endif %}
       {% endfor %}
-      {% for run_reg in run_regularly_operations %}
-        if ((i + 1) % {{run_reg['step']}} == 0)  // only pull state if next time step executes operation
-        {
-            {% for var in run_reg['read'] %}
-            {% if not var in ['t', 'dt'] %}
-            {% if not run_reg['owner'].variables[var].owner.name in states_pulled %}
-            pull{{run_reg['owner'].variables[var].owner.name}}StateFromDevice();
-            {% if states_pulled.append(run_reg['owner'].variables[var].owner.name) %}{% endif %}
-            {% endif %}
-            {% endif %}
-            {% endfor %}
-        }
-      {% endfor %}
-      // report state 
       {% for sm in state_monitor_models %}
-      {% if sm.when != 'start' %}
-      {% for var in sm.variables %}
-      {% if sm.isSynaptic %}
-      {% if sm.connectivity == 'DENSE' %}
-      convert_dense_matrix_2_dynamic_arrays({{var}}{{sm.monitored}}, {{sm.srcN}}, {{sm.trgN}},brian::_dynamic_array_{{sm.monitored}}__synaptic_pre, brian::_dynamic_array_{{sm.monitored}}__synaptic_post, brian::_dynamic_array_{{sm.monitored}}_{{var}});
-      {% else %}
-      convert_sparse_synapses_2_dynamic_arrays(rowLength{{sm.monitored}}, ind{{sm.monitored}}, maxRowLength{{sm.monitored}}, {{var}}{{sm.monitored}}, {{sm.srcN}}, {{sm.trgN}}, brian::_dynamic_array_{{sm.monitored}}__synaptic_pre, brian::_dynamic_array_{{sm.monitored}}__synaptic_post, brian::_dynamic_array_{{sm.monitored}}_{{var}}, b2g::FULL_MONTY);
-      {% endif %}
-      {% else %}
-      {% if sm.src.variables[var].scalar %}
-      *brian::_array_{{sm.monitored}}_{{var}} = {{var}}{{sm.monitored}};
+      {% if sm.step > 1 and not sm.monitored in states_pulled %}
+      {% if sm.when == 'start' %}
+      if ((i + 1) % {{sm.step}} == 0)  // only pull state if the monitor records the next time step
       {% else %}
-      std::copy_n({{var}}{{sm.monitored}}, {{sm.N}}, brian::_array_{{sm.monitored}}_{{var}});
+      if (i % {{sm.step}} == 0)  // only pull state if the monitor records this time step
       {% endif %}
+          pull{{sm.monitored}}StateFromDevice();
       {% endif %}
       {% endfor %}
-      _run_{{sm.codeobject_name}}();
+      {% for population, var, steps in run_regularly_pulls %}
+      {% if not population in states_pulled %}
+      if ({% for step in steps %}(i + 1) % {{step}} == 0{% if not loop.last %} || {% endif %}{% endfor %})  // only pull variable if next time step executes an operation reading it
+          pull{{var}}{{population}}FromDevice();
       {% endif %}
       {% endfor %}
-      // report spikes
-      {% for spkMon in spike_monitor_models %}
-      _run_{{spkMon.codeobject_name}}();
-      {% endfor %}
-      {% for rateMon in rate_monitor_models %}
-      _run_{{rateMon.codeobject_name}}();
-      {% endfor %}
+      {% if not overlap_monitors %}
+      report_monitors(i);
+      {% endif %}
       // Bring the time step back to the value for the next loop iteration
       iT++;
       t = iT*DT;
+      {% if overlap_monitors %}
+      last_step = i;
+      {% endif %}
       {% if maximum_run_time is not none %}
       current= std::clock();
       elapsed_realtime= (double) (current - start)/CLOCKS_PER_SEC;
@@ -276,11 +389,40 @@ void engine::run(double duration)  //!< Duration of time to run the model for
         break;
       }
       {% endif %}
+      {% if health_checks %}
+      if (i % {{health_check_interval}} == 0) {
+          // Stop the run if NaN or very large values have been found
+          {% for population, variables in health_checks %}
+          pull_health{{population}}FromDevice(1);
+          if (_health{{population}}[0])
+              health_check_failed = "{{population}} {{variables|join(' ')}}";
+          {% endfor %}
+          if (health_check_failed != NULL)
+              break;
+      }
+      {% endif %}
   }  
-  {% if maximum_run_time is none %}
+  {% if overlap_monitors %}
+  // Record the data of the last simulated time step
+  if (last_step >= 0) {
+      iT--;
+      t = iT*DT;
+      report_monitors(last_step);
+      iT++;
+      t = iT*DT;
+  }
+  {% endif %}
+  {% if health_checks %}
+  if (health_check_failed != NULL) {
+      FILE *health_check_file = fopen("results/health_check.txt", "w");
+      if (health_check_file != NULL) {
+          fprintf(health_check_file, "%.9g %s\n", t, health_check_failed);
+          fclose(health_check_file);
+      }
+  }
+  {% endif %}
   current= std::clock();
   elapsed_realtime= (double) (current - start)/CLOCKS_PER_SEC;
-  {% endif %}
   Network::_last_run_time = elapsed_realtime;
   if (duration > 0.0)
   {
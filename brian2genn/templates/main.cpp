@@ -53,6 +53,7 @@ int main(int argc, char *argv[])
   // load variables and parameters and translate them from Brian to Genn
   _init_arrays();
   _load_arrays();
+  _load_static_arrays();
   rk_randomseed(brian::_mersenne_twister_states[0]);
   {{'\n'.join(code_lines['after_start'])|autoindent}}
   {
@@ -120,6 +121,51 @@ int main(int argc, char *argv[])
   {% endif %}
   {% endfor %}
 
+  // upload the spike schedules of SpikeGeneratorGroups simulated on the device
+  {% for neuron in neuron_models %}
+  {% if neuron.spike_schedule and neuron.spike_schedule.stream %}
+  {% set stream = neuron.spike_schedule.stream %}
+  // the spikes are streamed from disk during the run, one window at a time
+  allocate_spike_bins{{neuron.name}}({{stream.capacity}});
+  _spike_stream_{{neuron.name}}.reset(new SpikeStream("{{stream.index_file}}", "{{stream.timebin_file}}", {{stream.num_spikes}}));
+  _period_bins{{neuron.name}} = {{stream.period}};
+  {% elif neuron.spike_schedule %}
+  {
+      const size_t _num_spikes = std::max(brian::{{neuron.spike_schedule.timebins}}.size(), (size_t)1);
+      allocate_spike_bins{{neuron.name}}(_num_spikes);
+      initialize_spike_generator(brian::{{neuron.spike_schedule.neuron_index}},
+                                 brian::{{neuron.spike_schedule.timebins}},
+                                 {{neuron.N}}, _row_start{{neuron.name}}, _row_end{{neuron.name}},
+                                 _next{{neuron.name}}, _spike_bins{{neuron.name}});
+      push_spike_bins{{neuron.name}}ToDevice(_num_spikes);
+      _period_bins{{neuron.name}} = brian::{{neuron.spike_schedule.period_bins}}[0];
+  }
+  {% endif %}
+  {% endfor %}
+
+  // allocate and reset the spike count buffers of PopulationRateMonitors
+  {% for rateMon in rate_monitor_models %}
+  {% if rateMon.counts_on_device %}
+  allocate_ratecount_{{rateMon.name}}{{rateMon.neuronGroup}}({{rateMon.num_records}});
+  std::fill_n(_ratecount_{{rateMon.name}}{{rateMon.neuronGroup}}, {{rateMon.num_records}}, 0);
+  push_ratecount_{{rateMon.name}}{{rateMon.neuronGroup}}ToDevice({{rateMon.num_records}});
+  {% endif %}
+  {% endfor %}
+
+  // reset the flags of the health checks
+  {% for population, variables in health_checks %}
+  allocate_health{{population}}(1);
+  _health{{population}}[0] = 0;
+  push_health{{population}}ToDevice(1);
+  {% endfor %}
+
+  // reset the spike counts of SpikeMonitors that only record counts
+  {% for neuron in neuron_models %}
+  {% if '_spike_count' in neuron.variables %}
+  std::fill_n(_spike_count{{neuron.name}}, {{neuron.N}}, 0);
+  {% endif %}
+  {% endfor %}
+
   // Perform final stage of initialization, uploading manually initialized variables to GPU etc
   initializeSparse();
   
@@ -133,6 +179,14 @@ int main(int argc, char *argv[])
   eng.run(totalTime); // run for the full duration
   {{'\n'.join(code_lines['after_run'])|autoindent}}
   cerr << t << " done ..." << endl;
+
+  // StateMonitors allocate their storage for the full run, only keep the
+  // recorded time steps (fewer if the run was interrupted)
+  {% for sm in state_monitor_models %}
+  {% for recorded in sm.recorded_arrays %}
+  brian::{{recorded}}.resize(brian::{{sm.t_array}}.size(), {{sm.n_indices}});
+  {% endfor %}
+  {% endfor %}
   {% if prefs['devices.genn.kernel_timing'] %}
   {% for kt in ('neuronUpdateTime', 'presynapticUpdateTime', 'postsynapticUpdateTime', 'synapseDynamicsTime', 'initTime', 'initSparseTime') %}
   fprintf(timef,"%f ", {{kt}});
@@ -143,6 +197,10 @@ int main(int argc, char *argv[])
   eng.getStateFromGPU();
   eng.getSpikesFromGPU();
 
+  // count NaN and very large values of variables updated by differential
+  // equations while copying them back
+  FILE *_invalid_states = fopen("results/invalid_states.txt", "w");
+
   // translate GeNN arrays back to synaptic arrays
   {% for synapses in synapse_models %}
   {% if synapses.connectivity == 'DENSE' %}
@@ -167,14 +225,27 @@ int main(int argc, char *argv[])
   {% endfor %} {# all synapse variables #}
   {% endif %} {# dense/sparse #}
   {% for var in synapses.shared_variables %}
+  {% if var in synapses.invalid_value_checks %}
+  write_invalid_value_count(_invalid_states, "{{synapses.name}}", "{{var}}",
+                            copy_and_count_invalid_values(&{{var}}{{synapses.name}}, 1, brian::_array_{{synapses.name}}_{{var}}));
+  {% else %}
   std::copy_n(&{{var}}{{synapses.name}}, 1, brian::_array_{{synapses.name}}_{{var}});
+  {% endif %}
   {% endfor %} {# shared variables #}
+  {% for var in synapses.invalid_value_checks if var not in synapses.shared_variables %}
+  write_invalid_value_count(_invalid_states, "{{synapses.name}}", "{{var}}",
+                            count_invalid_values(brian::_dynamic_array_{{synapses.name}}_{{var}}.data(),
+                                                 brian::_dynamic_array_{{synapses.name}}_{{var}}.size()));
+  {% endfor %}
   {% endfor %} {# all synapse_models #}
 
   // copy variable arrays
   {% for neuron in neuron_models %} 
   {% for var in neuron.variables %}
-  {% if neuron.variablescope[var] == 'brian' %}
+  {% if var in neuron.invalid_value_checks %}
+  write_invalid_value_count(_invalid_states, "{{neuron.name}}", "{{var}}",
+                            copy_and_count_invalid_values({{var}}{{neuron.name}}, {{neuron.N}}, brian::_array_{{neuron.name}}_{{var}}));
+  {% elif neuron.variablescope[var] == 'brian' %}
   std::copy_n({{var}}{{neuron.name}}, {{neuron.N}}, brian::_array_{{neuron.name}}_{{var}});
   {% endif %}
   {% endfor %}
@@ -183,13 +254,97 @@ int main(int argc, char *argv[])
   // copy scalar variables
   {% for neuron in neuron_models %}
   {% for var in neuron.shared_variables %}
+  {% if var in neuron.invalid_value_checks %}
+  write_invalid_value_count(_invalid_states, "{{neuron.name}}", "{{var}}",
+                            copy_and_count_invalid_values(&{{var}}{{neuron.name}}, 1, brian::_array_{{neuron.name}}_{{var}}));
+  {% else %}
   std::copy_n(&{{var}}{{neuron.name}}, 1, brian::_array_{{neuron.name}}_{{var}});
+  {% endif %}
   {% endfor %}
   {% endfor %}
+  if (_invalid_states != NULL)
+      fclose(_invalid_states);
+
+  // calculate the rates of PopulationRateMonitors from the spike counts
+  {% for rateMon in rate_monitor_models %}
+  {% if rateMon.counts_on_device %}
+  {
+      pull_ratecount_{{rateMon.name}}{{rateMon.neuronGroup}}FromDevice({{rateMon.num_records}});
+      for (int _k = 0; _k < iT && _k < {{rateMon.num_records}}; _k++)
+      {
+          brian::{{rateMon.rate_array}}.push_back(1.0*_ratecount_{{rateMon.name}}{{rateMon.neuronGroup}}[_k]/{{rateMon.clock_dt}}/{{rateMon.num_source_neurons}});
+          brian::{{rateMon.t_array}}.push_back(_k*DT);
+          brian::{{rateMon.N_array}}[0]++;
+      }
+  }
+  {% endif %}
+  {% endfor %}
+
+  // copy the spike counts of SpikeMonitors that only record counts
+  {% for spkMon in spike_monitor_models %}
+  {% if spkMon.counts_only %}
+  for (int _i = 0; _i < {{spkMon.source_stop - spkMon.source_start}}; _i++)
+  {
+      brian::{{spkMon.count_array}}[_i] += _spike_count{{spkMon.neuronGroup}}[{{spkMon.source_start}} + _i];
+      brian::{{spkMon.N_array}}[0] += _spike_count{{spkMon.neuronGroup}}[{{spkMon.source_start}} + _i];
+  }
+  {% endif %}
+  {% endfor %}
+
+  // store the spikes of SpikeMonitors as a bit-packed raster if this is smaller
+  {% for spkMon in compact_spike_monitors %}
+  if (write_spike_raster(brian::{{spkMon.i_array}}, brian::{{spkMon.t_array}},
+                         {{spkMon.N}}, iT, "results/{{spkMon.name}}_raster.bin"))
+  {
+      brian::{{spkMon.i_array}}.clear();
+      brian::{{spkMon.t_array}}.clear();
+  }
+  {% endfor %}
 
   {{'\n'.join(code_lines['before_end'])|autoindent}}
-  _write_arrays();
+  // write all arrays into a single results file
+  {
+      using namespace brian;
+      ResultsFile _results;
+      {% for name, kind, dtype in result_arrays %}
+      {% if kind == 'array' %}
+      _results.add("{{name}}", "{{dtype}}", sizeof({{name}}[0]), _num_{{name}});
+      {% elif kind == 'dynamic' %}
+      _results.add("{{name}}", "{{dtype}}", sizeof({{name}}[0]), {{name}}.size());
+      {% else %}
+      _results.add("{{name}}", "{{dtype}}", sizeof({{name}}(0, 0)), {{name}}.n, {{name}}.m);
+      {% endif %}
+      {% endfor %}
+      if (_results.open("results/{{results_filename}}"))
+      {
+          {% for name, kind, dtype in result_arrays %}
+          _results.start_array();
+          {% if kind == 'array' %}
+          _results.write({{name}}, _num_{{name}}*sizeof({{name}}[0]));
+          {% elif kind == 'dynamic' %}
+          _results.write({{name}}.data(), {{name}}.size()*sizeof({{name}}[0]));
+          {% else %}
+          for (size_t _row = 0; _row < {{name}}.n && {{name}}.m > 0; _row++)
+              _results.write(&{{name}}(_row, 0), {{name}}.m*sizeof({{name}}(0, 0)));
+          {% endif %}
+          {% endfor %}
+      }
+  }
+  FILE *_last_run_info = fopen("results/last_run_info.txt", "w");
+  if (_last_run_info != NULL)
+  {
+      fprintf(_last_run_info, "%.17g %.17g\n", Network::_last_run_time,
+              Network::_last_run_completed_fraction);
+      fclose(_last_run_info);
+  }
   _dealloc_arrays();
+  _unload_static_arrays();
+  // close the files of spike schedules streamed from disk
+  {% for neuron in neuron_models %}
+  {% if neuron.spike_schedule and neuron.spike_schedule.stream %}
+  _spike_stream_{{neuron.name}}.reset();
+  {% endif %}
+  {% endfor %}
   {{'\n'.join(code_lines['after_end'])|autoindent}}
   cerr << "everything finished." << endl;
   return 0;
@@ -6,6 +6,7 @@
 
 #include "objects.h"
 #include "objects.cpp"
+#include "static_arrays.cpp"
 // We need these to compile objects.cpp, but they are only used in _write_arrays which we never call.
 double Network::_last_run_time = 0.0;
 double Network::_last_run_completed_fraction = 0.0;
@@ -26,11 +27,11 @@ double Network::_last_run_completed_fraction = 0.0;
 //
 // define the neuron model classes
 
-{% for neuron_model in neuron_models %}
-class {{neuron_model.name}}NEURON : public NeuronModels::Base
+{% for neuron_model in neuron_models if neuron_model.defines_class %}
+class {{neuron_model.model_class}} : public NeuronModels::Base
 {
 public:
-    DECLARE_MODEL({{neuron_model.name}}NEURON, {{neuron_model.pvalue.__len__()}}, {{neuron_model.variables.__len__()}});
+    DECLARE_MODEL({{neuron_model.model_class}}, {{neuron_model.pvalue.__len__()}}, {{neuron_model.variables.__len__()}});
 
     SET_SIM_CODE("{% for line in neuron_model.code_lines %}{{line}}{% endfor %}");
     SET_THRESHOLD_CONDITION_CODE("{% for line in neuron_model.thresh_cond_lines %}{{line}}{% endfor %}");
@@ -49,22 +50,31 @@ public:
     {% endfor %}
     });
     SET_EXTRA_GLOBAL_PARAMS({
-    {% for var,type in zip(neuron_model.shared_variables, neuron_model.shared_variabletypes) %}
+    {% set extra_global_params = zip(neuron_model.shared_variables, neuron_model.shared_variabletypes)|list + neuron_model.extra_global_params %}
+    {% for var,type in extra_global_params %}
         {"{{var}}", "{{type}}"}{% if not loop.last %},{% endif %}
     {% endfor %}
     });
+    {% if neuron_model.derived_param_code %}
+    SET_DERIVED_PARAMS({
+    {% for name, code in neuron_model.derived_param_code %}
+        {"{{name}}", [](const std::vector<double> &pars, double dt){ return {{code}}; }}{% if not loop.last %},{% endif %}
+    {% endfor %}
+    });
+    {% endif %}
     SET_NEEDS_AUTO_REFRACTORY(false);
 };
-IMPLEMENT_MODEL({{neuron_model.name}}NEURON);
+IMPLEMENT_MODEL({{neuron_model.model_class}});
 {% endfor %}
 
 //
 // define the synapse model classes
 {% for synapse_model in synapse_models %}
-class {{synapse_model.name}}WEIGHTUPDATE : public WeightUpdateModels::Base
+{% if synapse_model.defines_weight_update_class %}
+class {{synapse_model.weight_update_class}} : public WeightUpdateModels::Base
 {
 public:
-    DECLARE_MODEL({{synapse_model.name}}WEIGHTUPDATE, {{synapse_model.pvalue.__len__()}}, {{synapse_model.variables.__len__() + (1 if synapse_model.connectivity == 'DENSE' else 0)}});
+    DECLARE_MODEL({{synapse_model.weight_update_class}}, {{synapse_model.pvalue.__len__()}}, {{synapse_model.variables.__len__() + (1 if synapse_model.connectivity == 'DENSE' else 0)}});
 
     SET_SIM_CODE("{% for line in synapse_model.main_code_lines['pre'] %}{{line}}{% endfor %}");
     SET_LEARN_POST_CODE("{% for line in synapse_model.main_code_lines['post'] %}{{line}}{% endfor %}");
@@ -94,28 +104,39 @@ public:
         {"{{var}}", "{{type}}"}{% if not loop.last %},{% endif %}
     {% endfor %}
     });
+    {% if synapse_model.derived_param_code %}
+
+    SET_DERIVED_PARAMS({
+    {% for name, code in synapse_model.derived_param_code %}
+        {"{{name}}", [](const std::vector<double> &pars, double dt){ return {{code}}; }}{% if not loop.last %},{% endif %}
+    {% endfor %}
+    });
+    {% endif %}
 
     //SET_NEEDS_PRE_SPIKE_TIME(true);
     //SET_NEEDS_POST_SPIKE_TIME(true);
 
 };
 
-IMPLEMENT_MODEL({{synapse_model.name}}WEIGHTUPDATE);
+IMPLEMENT_MODEL({{synapse_model.weight_update_class}});
+{% endif %}
 
-class {{synapse_model.name}}POSTSYN : public PostsynapticModels::Base
+{% if synapse_model.defines_postsynaptic_class %}
+class {{synapse_model.postsynaptic_class}} : public PostsynapticModels::Base
 {
 public:
-    DECLARE_MODEL({{synapse_model.name}}POSTSYN, 0, 0);
+    DECLARE_MODEL({{synapse_model.postsynaptic_class}}, 0, 0);
 
     SET_APPLY_INPUT_CODE("$(Isyn) += {% for line in synapse_model.postSyntoCurrent %}{{line}}{% endfor %};");
 };
-IMPLEMENT_MODEL({{synapse_model.name}}POSTSYN);
+IMPLEMENT_MODEL({{synapse_model.postsynaptic_class}});
+{% endif %}
 {% endfor %}
 
 // parameter values
 // neurons
 {% for neuron_model in neuron_models %}
-{{neuron_model.name}}NEURON::ParamValues {{neuron_model.name}}_p
+{{neuron_model.model_class}}::ParamValues {{neuron_model.name}}_p
 {% if neuron_model.pvalue.__len__() > 0 %}
 (
 {% for k in neuron_model.pvalue %}
@@ -126,7 +147,7 @@ IMPLEMENT_MODEL({{synapse_model.name}}POSTSYN);
 
 // synapses
 {% for synapse_model in synapse_models %}
-{{synapse_model.name}}WEIGHTUPDATE::ParamValues {{synapse_model.name}}_p
+{{synapse_model.weight_update_class}}::ParamValues {{synapse_model.name}}_p
 {% if synapse_model.pvalue.__len__() > 0 %}
 (
 {% for k in synapse_model.pvalue %}
@@ -137,7 +158,7 @@ IMPLEMENT_MODEL({{synapse_model.name}}POSTSYN);
 
 // initial variables (neurons)
 {% for neuron_model in neuron_models %}
-{{neuron_model.name}}NEURON::VarValues {{neuron_model.name}}_ini
+{{neuron_model.model_class}}::VarValues {{neuron_model.name}}_ini
 {% if neuron_model.variables.__len__() > 0 %}
 (
     {% for k in neuron_model.variables %}
@@ -149,7 +170,7 @@ IMPLEMENT_MODEL({{synapse_model.name}}POSTSYN);
 // initial variables (synapses)
 // one additional initial variable for hidden_weightmatrix
 {% for synapse_model in synapse_models %}
-{{synapse_model.name}}WEIGHTUPDATE::VarValues {{synapse_model.name}}_ini
+{{synapse_model.weight_update_class}}::VarValues {{synapse_model.name}}_ini
 {% if synapse_model.variables.__len__() > 0 or synapse_model.connectivity == 'DENSE' %}
 (
     {% for k in synapse_model.variables %}
@@ -166,6 +187,7 @@ void modelDefinition(NNmodel &model)
 {
   _init_arrays();
   _load_arrays();
+  _load_static_arrays();
   {{'\n'.join(code_lines['before_start'])|autoindent}}
   rk_randomseed(brian::_mersenne_twister_states[0]);
   {{'\n'.join(code_lines['after_start'])|autoindent}}
@@ -204,6 +226,16 @@ void modelDefinition(NNmodel &model)
         {{prefs['devices.genn.cuda_backend.pre_synapse_reset_blocksize']}}};
     {% endif %}
     GENN_PREFERENCES.userNvccFlags = "{{' '.join(prefs['devices.genn.cuda_backend.extra_compile_args_nvcc'])}}";
+    // support code shared by all models
+    GENN_PREFERENCES.userNvccFlags += " -include \"{{support_code_header}}\"";
+    {% endif %}
+    // support code shared by all models
+    GENN_PREFERENCES.userCxxFlagsGNU += " -include \"{{support_code_header}}\"";
+    GENN_PREFERENCES.userCxxFlagsWIN += " /FI\"{{support_code_header}}\"";
+    {% if not use_GPU %}
+    // additional flags set by Brian2GeNN when calling make (used for
+    // profile-guided optimisation)
+    GENN_PREFERENCES.userCxxFlagsGNU += " $(BRIAN2GENN_EXTRA_CXXFLAGS)";
     {% endif %}
 
     {{ dtDef }}
@@ -217,7 +249,7 @@ void modelDefinition(NNmodel &model)
     model.setTiming(true);
     {% endif %}
     {% for neuron_model in neuron_models %}
-    model.addNeuronPopulation<{{neuron_model.name}}NEURON>("{{neuron_model.name}}", {{neuron_model.N}}, {{neuron_model.name}}_p, {{neuron_model.name}}_ini);
+    model.addNeuronPopulation<{{neuron_model.model_class}}>("{{neuron_model.name}}", {{neuron_model.N}}, {{neuron_model.name}}_p, {{neuron_model.name}}_ini);
     {% endfor %}
     {% for spikeGen_model in spikegenerator_models %}
     model.addNeuronPopulation<NeuronModels::SpikeSource>("{{spikeGen_model.name}}", {{spikeGen_model.N}}, {}, {});
@@ -230,7 +262,7 @@ void modelDefinition(NNmodel &model)
     {% else %}
     const unsigned int delaySteps = {{synapse_model.delay}};
     {% endif %}
-    auto *syn = model.addSynapsePopulation<{{synapse_model.name}}WEIGHTUPDATE, {{synapse_model.name}}POSTSYN>(
+    auto *syn = model.addSynapsePopulation<{{synapse_model.weight_update_class}}, {{synapse_model.postsynaptic_class}}>(
         "{{synapse_model.name}}", SynapseMatrixType::{{synapse_model.connectivity}}_INDIVIDUALG, delaySteps,
         "{{synapse_model.srcname}}", "{{synapse_model.trgname}}",
         {{synapse_model.name}}_p, {{synapse_model.name}}_ini,
@@ -1,5 +1,13 @@
 {# ALLOWS_SCALAR_WRITE #}
 {% macro stateupdate_code() %}
+// run_regularly operations executed on the device (if any)
+{% for block, step in run_regularly_operations %}
+if (((int)(t/DT + 0.5)) % {{step}} == 0)
+{
+    {{(scalar_code[block] + vector_code[block])|autoindent}}
+}
+{% endfor %}
+
 // Update "constant over dt" subexpressions (if any)
 {{(scalar_code['subexpression_update'] + vector_code['subexpression_update'])|autoindent}}
 
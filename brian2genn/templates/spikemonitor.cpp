@@ -33,7 +33,11 @@
 	    if ((_idx >= _source_start) && (_idx < _source_stop)) {
 		{% for varname, var in record_variables.items() %}
 		{% if varname == 't' %}
+		{% if _compact_t %}
+		{{get_array_name(var, access_data=False)}}.push_back(iT);
+		{% else %}
 		{{get_array_name(var, access_data=False)}}.push_back(t);
+		{% endif %}
 		{% else %}
 		{% if varname == 'i' %}
 		{{get_array_name(var, access_data=False)}}.push_back(_idx - _source_start);
@@ -7,16 +7,26 @@
 {% block maincode %}
     {# USES_VARIABLES { t, _clock_t, _indices, N } #}
     {# WRITES_TO_READ_ONLY_VARIABLES { t, N } #}
+    const int _new_size = {{_dynamic_t}}.size() + 1;
+    {{ openmp_pragma('single') }}
+    if (_new_size == 1)
+    {
+        // Allocate the storage for all time steps of the run at once
+        {{_dynamic_t}}.reserve({{_num_records}});
+        {% for varname, var in _recorded_variables | dictsort %}
+        {% set _recorded =  get_array_name(var, access_data=False) %}
+        {{_recorded}}.resize({{_num_records}}, _num_indices);
+        {% endfor %}
+    }
     {{ openmp_pragma('single') }}
     {{_dynamic_t}}.push_back(t);
 
-    const int _new_size = {{_dynamic_t}}.size();
-    // Resize the dynamic arrays
+    // Only resize the dynamic arrays if the preallocated storage is exhausted
     {% for varname, var in _recorded_variables | dictsort %}
     {% set _recorded =  get_array_name(var, access_data=False) %}
-
     {{ openmp_pragma('single') }}
-    {{_recorded}}.resize(_new_size, _num_indices);
+    if (_new_size > {{_recorded}}.n)
+        {{_recorded}}.resize(_new_size, _num_indices);
     {% endfor %}
 
     // scalar code
@@ -32,7 +42,7 @@
         {{vector_code|autoindent}}
         {% for varname, var in _recorded_variables | dictsort %}
         {% set _recorded =  get_array_name(var, access_data=False) %}
-        {{_recorded}}(_new_size-1, _i) = _to_record_{{varname}};
+        {{_recorded}}(_new_size-1, _i) = ({{_storage_types[varname]}})_to_record_{{varname}};
         {% endfor %}
     }
     {{N}} = _new_size;
@@ -0,0 +1,97 @@
+{# Static arrays, stored in a single file and memory-mapped instead of being
+   loaded from one file per array by Brian2's objects.cpp #}
+{% macro cpp_file() %}
+#include "static_arrays.h"
+
+#include <cstdio>
+#include <cstdlib>
+#ifndef _WIN32
+#include <sys/mman.h>
+#include <fcntl.h>
+#include <unistd.h>
+#endif
+
+namespace brian {
+
+{% for (name, dtype_spec, N, offset) in static_array_specs %}
+{{dtype_spec}} * {{name}};
+const int _num_{{name}} = {{N}};
+{% endfor %}
+
+static char *_static_array_data = NULL;
+
+void _load_static_arrays()
+{
+{% if blob_size > 0 %}
+#ifdef _WIN32
+	// No memory mapping: read the complete file
+	_static_array_data = (char *)malloc({{blob_size}});
+	FILE *f = fopen("{{blob_filename}}", "rb");
+	if (f == NULL || fread(_static_array_data, 1, {{blob_size}}, f) != {{blob_size}})
+	{
+		fprintf(stderr, "Error reading static arrays from {{blob_filename}}.\n");
+		exit(1);
+	}
+	fclose(f);
+#else
+	// Map the file copy-on-write: pages are shared with the page cache (and
+	// other processes using the same file) unless they are written to
+	int fd = open("{{blob_filename}}", O_RDONLY);
+	if (fd == -1)
+	{
+		fprintf(stderr, "Error opening static arrays in {{blob_filename}}.\n");
+		exit(1);
+	}
+	void *mapped = mmap(NULL, {{blob_size}}, PROT_READ | PROT_WRITE, MAP_PRIVATE, fd, 0);
+	close(fd);
+	if (mapped == MAP_FAILED)
+	{
+		fprintf(stderr, "Error memory-mapping static arrays in {{blob_filename}}.\n");
+		exit(1);
+	}
+	_static_array_data = (char *)mapped;
+#endif
+{% endif %}
+	{% for (name, dtype_spec, N, offset) in static_array_specs %}
+	{{name}} = ({{dtype_spec}} *)(_static_array_data + {{offset}});
+	{% endfor %}
+}
+
+void _unload_static_arrays()
+{
+	if (_static_array_data == NULL)
+		return;
+#ifdef _WIN32
+	free(_static_array_data);
+#else
+	munmap(_static_array_data, {{blob_size}});
+#endif
+	_static_array_data = NULL;
+	{% for (name, dtype_spec, N, offset) in static_array_specs %}
+	{{name}} = 0;
+	{% endfor %}
+}
+
+}
+{% endmacro %}
+
+{% macro h_file() %}
+#ifndef _BRIAN_STATIC_ARRAYS_H
+#define _BRIAN_STATIC_ARRAYS_H
+
+#include <stdint.h>
+
+namespace brian {
+
+{% for (name, dtype_spec, N, offset) in static_array_specs %}
+extern {{dtype_spec}} *{{name}};
+extern const int _num_{{name}};
+{% endfor %}
+
+void _load_static_arrays();
+void _unload_static_arrays();
+
+}
+
+#endif
+{% endmacro %}
@@ -0,0 +1,56 @@
+'''
+Scaling benchmark for the generation of code objects: builds (without
+compiling) networks with a NeuronGroup and an increasing number of
+run_regularly operations executed on the host (one code object each) and a
+StateMonitor, and reports the time spent in the code object generation and in
+the complete build.
+
+Usage: python benchmark_code_object_generation.py [number of code objects ...]
+'''
+import shutil
+import sys
+import tempfile
+import time
+
+from brian2 import *
+import brian2genn
+
+prefs.devices.genn.device_run_regularly = False
+
+
+def benchmark(num_code_objects):
+    device.reinit()
+    device.activate(build_on_run=False)
+    G = NeuronGroup(10, 'dv/dt = -v / (10*ms) : 1')
+    for i in range(num_code_objects):
+        G.run_regularly('v += %d*0.001' % (i % 10), dt=defaultclock.dt,
+                        name='operation_%d' % i)
+    StateMonitor(G, 'v', record=True)
+    run(defaultclock.dt)
+
+    generation_times = []
+    generate_code_objects = device.generate_code_objects
+
+    def timed_generate_code_objects(writer):
+        start = time.time()
+        generate_code_objects(writer)
+        generation_times.append(time.time() - start)
+    device.generate_code_objects = timed_generate_code_objects
+
+    directory = tempfile.mkdtemp()
+    try:
+        start = time.time()
+        device.build(directory=directory, compile=False, run=False)
+        build_time = time.time() - start
+    finally:
+        shutil.rmtree(directory)
+    return sum(generation_times), build_time
+
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000]
+    set_device('genn', build_on_run=False)
+    print('%12s %18s %12s' % ('code objects', 'generation (s)', 'build (s)'))
+    for count in counts:
+        generation_time, build_time = benchmark(count)
+        print('%12d %18.2f %12.2f' % (count, generation_time, build_time))
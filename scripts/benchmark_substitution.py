@@ -0,0 +1,86 @@
+'''
+Benchmark of the substitution of identifiers in generated code (`freeze` and
+`decorate`), comparing the single-pass implementation with the previous
+implementation that used one `word_substitute` pass per identifier. Both
+implementations are checked to give identical results.
+
+Usage: python benchmark_substitution.py [number of variables] [number of lines]
+'''
+import itertools
+import random
+import re
+import sys
+import time
+
+from brian2.utils.stringtools import word_substitute
+from brian2.codegen.generators.cpp_generator import CPPNodeRenderer
+
+from brian2genn.device import freeze, decorate, stringify
+
+
+def freeze_per_identifier(code, ns):
+    for k, v in ns.items():
+        if isinstance(v, str):
+            code = word_substitute(code, {k: v})
+        else:
+            renderer = CPPNodeRenderer()
+            string_value = renderer.render_expr(repr(v))
+            if v < 0:
+                string_value = '(%s)' % string_value
+            code = word_substitute(code, {k: string_value})
+    return code
+
+
+def decorate_per_identifier(code, variables, shared_variables, parameters):
+    for v in itertools.chain(variables, shared_variables, parameters):
+        code = word_substitute(code, {v: '$(' + v + ')'})
+    code = word_substitute(code, {'dt': 'DT'}).strip()
+    code = stringify(code)
+    code = re.sub(r'addtoinSyn\s*=\s*(.*);', r'$(addToInSyn,\1);', code)
+    code = word_substitute(code, {'_hidden_weightmatrix': '$(_hidden_weightmatrix)'})
+    return code
+
+
+def generate_model(num_variables, num_lines):
+    random.seed(42)
+    variables = ['v%d' % i for i in range(num_variables)]
+    parameters = ['p%d' % i for i in range(num_variables)]
+    constants = dict(('c%d' % i, random.uniform(-10, 10))
+                     for i in range(num_variables))
+    identifiers = variables + parameters + list(constants) + ['dt']
+    lines = []
+    for _ in range(num_lines):
+        target = random.choice(variables)
+        terms = [random.choice(identifiers) for _ in range(8)]
+        lines.append('%s = %s + dt*(%s);' % (target, target,
+                                             ' * '.join(terms)))
+    return '\n'.join(lines), variables, parameters, constants
+
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return result, time.time() - start
+
+
+if __name__ == '__main__':
+    num_variables = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    num_lines = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    code, variables, parameters, constants = generate_model(num_variables,
+                                                            num_lines)
+    print('Model with %d variables, %d parameters, %d constants and %d lines'
+          % (len(variables), len(parameters), len(constants), num_lines))
+
+    old_frozen, old_time = timed(freeze_per_identifier, code, constants)
+    new_frozen, new_time = timed(freeze, code, constants)
+    assert old_frozen == new_frozen, 'freeze results differ'
+    print('freeze:   %8.3fs (per identifier) %8.3fs (single pass) %6.1fx'
+          % (old_time, new_time, old_time / max(new_time, 1e-9)))
+
+    old_decorated, old_time = timed(decorate_per_identifier, old_frozen,
+                                    variables, [], parameters)
+    new_decorated, new_time = timed(decorate, new_frozen,
+                                    variables, [], parameters)
+    assert old_decorated == new_decorated, 'decorate results differ'
+    print('decorate: %8.3fs (per identifier) %8.3fs (single pass) %6.1fx'
+          % (old_time, new_time, old_time / max(new_time, 1e-9)))
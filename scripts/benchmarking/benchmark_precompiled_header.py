@@ -0,0 +1,60 @@
+'''
+Measures the compile time of the host-side project (main.cpp, objects.cpp and
+all code objects) for the Mbody benchmark, with and without the precompiled
+header (preference ``devices.genn.precompiled_header``). The model is built
+once for each setting with Mbody_example.py (without running the
+simulation), then the host project is recompiled several times with make.
+
+Usage: python benchmark_precompiled_header.py [scaling] [threads] [repeats]
+'''
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+WORKSPACE = 'GeNNworkspace'
+
+BUILD_CODE = '''
+import runpy, sys
+from brian2 import prefs
+prefs.devices.genn.precompiled_header = {precompiled_header}
+sys.argv = ['Mbody_example.py', '{scaling}', 'genn', '{threads}', 'false', 'false']
+runpy.run_path('Mbody_example.py', run_name='__main__')
+'''
+
+
+def compile_times(precompiled_header, scaling, threads, repeats):
+    if os.path.exists(WORKSPACE):
+        shutil.rmtree(WORKSPACE)
+    code = BUILD_CODE.format(precompiled_header=precompiled_header,
+                             scaling=scaling, threads=threads)
+    subprocess.check_call([sys.executable, '-c', code])
+    times = []
+    for _ in range(repeats):
+        for fname in ['main', 'brian2genn_pch.h.gch']:
+            path = os.path.join(WORKSPACE, fname)
+            if os.path.exists(path):
+                os.remove(path)
+        start = time.time()
+        subprocess.check_call(['make', 'main'], cwd=WORKSPACE,
+                              stdout=subprocess.DEVNULL)
+        times.append(time.time() - start)
+    shutil.rmtree(WORKSPACE)
+    return times
+
+
+if __name__ == '__main__':
+    scaling = sys.argv[1] if len(sys.argv) > 1 else '1'
+    threads = sys.argv[2] if len(sys.argv) > 2 else '-1'
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    results = {}
+    for precompiled_header in [False, True]:
+        results[precompiled_header] = compile_times(precompiled_header,
+                                                    scaling, threads, repeats)
+    print('%22s %10s %10s' % ('', 'min (s)', 'mean (s)'))
+    for precompiled_header in [False, True]:
+        times = results[precompiled_header]
+        label = 'precompiled header' if precompiled_header else 'no precompiled header'
+        print('%22s %10.2f %10.2f' % (label, min(times), sum(times) / len(times)))
+    print('Reduction: %.1f%%' % (100 * (1 - min(results[True]) / min(results[False]))))
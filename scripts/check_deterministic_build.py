@@ -0,0 +1,89 @@
+'''
+Check that the code generation is deterministic: builds (without compiling)
+the same model several times, each time in a new Python process with a
+different hash seed (which changes the iteration order of sets) and in a
+different directory, and checks that all generated files are byte-identical.
+
+Usage: python check_deterministic_build.py [number of builds]
+'''
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+def build(directory):
+    from brian2 import (set_device, device, NeuronGroup, Synapses,
+                        SpikeMonitor, StateMonitor, PoissonGroup, run, ms, mV)
+    import brian2genn
+    set_device('genn', directory=directory, compile=False, run=False)
+    eqs = '''dv/dt = (ge + gi - (v + 49*mV)) / (20*ms) : volt
+             dge/dt = -ge / (5*ms) : volt
+             dgi/dt = -gi / (10*ms) : volt'''
+    P = NeuronGroup(400, eqs, threshold='v > -50*mV', reset='v = -60*mV',
+                    refractory=5*ms, method='exact', name='P')
+    P.v = '-60*mV + 10*mV*rand()'
+    Pe = P[:320]
+    Pi = P[320:]
+    Ce = Synapses(Pe, P, 'w : volt', on_pre='ge += w', name='Ce')
+    Ci = Synapses(Pi, P, 'w : volt', on_pre='gi += w', name='Ci')
+    Ce.connect(p=0.02)
+    Ci.connect(p=0.02)
+    Ce.w = 1.62*mV
+    Ci.w = -9*mV
+    inputs = PoissonGroup(50, rates='10*Hz', name='inputs')
+    Cin = Synapses(inputs, P, on_pre='ge += 0.5*mV', name='Cin')
+    Cin.connect(p=0.1)
+    SpikeMonitor(P, name='spikes')
+    StateMonitor(P, 'v', record=[0, 1], name='voltage')
+    run(10*ms)
+
+
+def hash_directory(directory):
+    '''
+    Return a dictionary mapping each file (relative to ``directory``) to the
+    SHA-256 hash of its content.
+    '''
+    hashes = {}
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for fname in sorted(files):
+            path = os.path.join(root, fname)
+            with open(path, 'rb') as f:
+                hashes[os.path.relpath(path, directory)] = hashlib.sha256(f.read()).hexdigest()
+    return hashes
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == '--build':
+        build(sys.argv[2])
+        sys.exit(0)
+    num_builds = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    tmp_dir = tempfile.mkdtemp()
+    all_hashes = []
+    try:
+        for seed in range(num_builds):
+            # The generated code should not depend on the project directory
+            directory = os.path.join(tmp_dir, 'output_%d' % seed)
+            env = dict(os.environ, PYTHONHASHSEED=str(seed))
+            subprocess.check_call([sys.executable, os.path.abspath(__file__),
+                                   '--build', directory], env=env)
+            all_hashes.append(hash_directory(directory))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    reference = all_hashes[0]
+    differences = set()
+    for hashes in all_hashes[1:]:
+        for fname in set(reference) | set(hashes):
+            if reference.get(fname) != hashes.get(fname):
+                differences.add(fname)
+    if differences:
+        print('Generated files differ between builds:')
+        for fname in sorted(differences):
+            print('  ' + fname)
+        sys.exit(1)
+    print('%d builds produced identical files (%d files)' % (num_builds,
+                                                            len(reference)))